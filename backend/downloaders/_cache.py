@@ -0,0 +1,116 @@
+"""
+Cache en memoria con TTL + LRU para llamadas async
+Usado para no repetir consultas de metadata (oEmbed, tikwm) sobre la misma URL
+y búsquedas de YouTube del agente
+"""
+
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Parámetros de tracking que no cambian el contenido de la URL
+_TRACKING_PARAMS = {"si", "feature", "pp", "is_from_webapp", "sender_device", "_r", "_t"}
+
+# Marca para que las llamadas en espera reintenten si la llamada original falla
+_RETRY = object()
+
+
+def normalize_url(url: str) -> str:
+    """Normalizar URL para usarla como clave de cache"""
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query)
+        if k not in _TRACKING_PARAMS and not k.startswith("utm_")
+    )
+    return urlunsplit((
+        parts.scheme.lower() or "https",
+        parts.netloc.lower(),
+        parts.path.rstrip("/"),
+        urlencode(query),
+        ""
+    ))
+
+
+def _is_cacheable(result) -> bool:
+    """Por defecto no se guardan los resultados con success=False"""
+    return not (isinstance(result, dict) and result.get("success") is False)
+
+
+def async_ttl_cache(
+    ttl: float = 600,
+    maxsize: int = 512,
+    key: Callable[[str], str] = normalize_url,
+    should_cache: Callable[[Any], bool] = _is_cacheable
+):
+    """
+    Decorador para métodos async `(self, url, ...)` que cachea el resultado por URL
+
+    Las llamadas concurrentes con la misma URL comparten una sola ejecución
+    (p. ej. el preview y la descarga de TikTok consultando tikwm a la vez).
+
+    Args:
+        ttl: Segundos que se guarda cada resultado
+        maxsize: Máximo de entradas (LRU)
+        key: Normaliza el primer argumento para usarlo como clave
+        should_cache: Decide si un resultado se guarda (por defecto, no los success=False)
+    """
+    def decorator(func):
+        cache: OrderedDict = OrderedDict()
+        inflight: dict = {}
+        lock = asyncio.Lock()
+
+        @functools.wraps(func)
+        async def wrapper(self, url: str, *args, **kwargs):
+            cache_key = (key(url), args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+
+            async with lock:
+                entry = cache.get(cache_key)
+                if entry is not None:
+                    expiry, result = entry
+                    if expiry > now:
+                        cache.move_to_end(cache_key)
+                        return result
+                    del cache[cache_key]
+
+                future = inflight.get(cache_key)
+                owner = future is None
+                if owner:
+                    future = asyncio.get_running_loop().create_future()
+                    inflight[cache_key] = future
+
+            if not owner:
+                # Ya hay una llamada en curso con esta URL: esperar su resultado
+                result = await asyncio.shield(future)
+                if result is not _RETRY:
+                    return result
+                # La llamada original falló o fue cancelada: ejecutar por cuenta propia
+                return await func(self, url, *args, **kwargs)
+
+            try:
+                result = await func(self, url, *args, **kwargs)
+            except BaseException:
+                future.set_result(_RETRY)
+                raise
+            finally:
+                inflight.pop(cache_key, None)
+
+            future.set_result(result)
+
+            if not should_cache(result):
+                return result
+
+            async with lock:
+                cache[cache_key] = (time.monotonic() + ttl, result)
+                cache.move_to_end(cache_key)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,38 @@
+"""
+Cliente HTTP compartido
+Un solo httpx.AsyncClient (HTTP/2 + pool de conexiones) para todos los downloaders,
+así las conexiones TCP/TLS se reutilizan entre llamadas
+"""
+
+import asyncio
+from typing import Optional
+
+import httpx
+
+_client: Optional[httpx.AsyncClient] = None
+_lock = asyncio.Lock()
+
+
+async def shared_client() -> httpx.AsyncClient:
+    """Obtener el cliente HTTP compartido (se crea en el primer uso)"""
+    global _client
+
+    if _client is None:
+        async with _lock:
+            if _client is None:
+                _client = httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+                    timeout=httpx.Timeout(30.0, connect=5.0),
+                    headers={"Accept": "application/json"}
+                )
+    return _client
+
+
+async def close_shared_client():
+    """Cerrar el cliente HTTP compartido (shutdown de la app)"""
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,13 @@
+"""
+Nombres de archivo únicos para las descargas
+"""
+
+import itertools
+import time
+
+_seq = itertools.count()
+
+
+def unique_suffix() -> str:
+    """Sufijo único por descarga (reloj en ns + contador del proceso, en hex)"""
+    return f"{time.time_ns():x}{next(_seq) & 0xfff:03x}"
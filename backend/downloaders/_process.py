@@ -0,0 +1,87 @@
+"""
+Ejecución asíncrona de procesos externos (yt-dlp)
+No bloquea el event loop mientras el proceso está corriendo
+"""
+
+import asyncio
+import subprocess
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+# Líneas de salida que se conservan para logs / mensajes de error
+OUTPUT_TAIL_LINES = 20
+
+
+async def run_command(
+    cmd: List[str],
+    timeout: float,
+    on_line: Optional[Callable[[str], None]] = None
+) -> Tuple[int, str]:
+    """
+    Ejecutar un comando sin bloquear el event loop
+
+    La salida (stdout + stderr combinados) se lee línea por línea; solo se
+    conservan las últimas OUTPUT_TAIL_LINES líneas.
+
+    Args:
+        cmd: Comando y argumentos
+        timeout: Tiempo máximo en segundos
+        on_line: Callback opcional llamado con cada línea de salida
+
+    Returns:
+        tupla (returncode, últimas líneas de salida)
+
+    Raises:
+        asyncio.TimeoutError: si el proceso excede el timeout (el proceso se mata)
+        FileNotFoundError: si el ejecutable no existe
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=1024 * 1024
+        )
+    except NotImplementedError:
+        # SelectorEventLoop en Windows (p. ej. uvicorn --reload) no soporta subprocesos:
+        # ejecutar la versión síncrona en un thread para no bloquear el loop
+        return await asyncio.to_thread(_run_command_sync, cmd, timeout)
+
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+
+    async def read_output():
+        async for raw in process.stdout:
+            line = raw.decode("utf-8", errors="replace").rstrip()
+            if not line:
+                continue
+            tail.append(line)
+            if on_line:
+                on_line(line)
+        await process.wait()
+
+    try:
+        await asyncio.wait_for(read_output(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+
+    return process.returncode, "\n".join(tail)
+
+
+def _run_command_sync(cmd: List[str], timeout: float) -> Tuple[int, str]:
+    """Versión síncrona de run_command (fallback para Windows, sin callback de progreso)"""
+    try:
+        result = subprocess.run(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=timeout
+        )
+    except subprocess.TimeoutExpired as e:
+        raise asyncio.TimeoutError() from e
+
+    lines = [line for line in result.stdout.decode("utf-8", errors="replace").splitlines() if line.strip()]
+    return result.returncode, "\n".join(lines[-OUTPUT_TAIL_LINES:])
@@ -0,0 +1,88 @@
+"""
+Cache persistente track de Spotify -> video de YouTube
+Evita repetir la búsqueda ytsearch cuando se vuelve a descargar el mismo track
+"""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Optional
+
+import aiosqlite
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class TrackCache:
+    """Mapa track_id (Spotify) -> video_id (YouTube) guardado en SQLite con TTL"""
+
+    def __init__(self, db_path: Path, ttl: float = 30 * 24 * 3600):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._db: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Conexión compartida, abierta (y con el esquema creado) en el primer uso"""
+        if self._db is None:
+            async with self._lock:
+                if self._db is None:
+                    db = await aiosqlite.connect(self.db_path)
+                    try:
+                        await db.execute(_SCHEMA)
+                        await db.commit()
+                    except Exception:
+                        await db.close()
+                        raise
+                    self._db = db
+        return self._db
+
+    async def close(self):
+        """Cerrar la conexión compartida (si se llegó a abrir)"""
+        if self._db is not None:
+            db, self._db = self._db, None
+            await db.close()
+
+    async def get(self, track_id: str) -> Optional[str]:
+        """Obtener el video_id guardado para un track (None si no existe o expiró)"""
+        try:
+            db = await self._connect()
+            async with db.execute(
+                "SELECT video_id, updated_at FROM tracks WHERE track_id = ?",
+                (track_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            if row and time.time() - row[1] < self.ttl:
+                return row[0]
+            return None
+        except Exception as e:
+            print(f"[Spotify] Error leyendo cache de tracks: {str(e)}")
+            return None
+
+    async def set(self, track_id: str, video_id: str):
+        """Guardar el video_id usado para un track"""
+        try:
+            db = await self._connect()
+            await db.execute(
+                "INSERT OR REPLACE INTO tracks (track_id, video_id, updated_at) VALUES (?, ?, ?)",
+                (track_id, video_id, time.time())
+            )
+            await db.commit()
+        except Exception as e:
+            print(f"[Spotify] Error guardando cache de tracks: {str(e)}")
+
+    async def delete(self, track_id: str):
+        """Borrar un track del cache (p. ej. si el video ya no está disponible)"""
+        try:
+            db = await self._connect()
+            await db.execute("DELETE FROM tracks WHERE track_id = ?", (track_id,))
+            await db.commit()
+        except Exception as e:
+            print(f"[Spotify] Error borrando cache de tracks: {str(e)}")
@@ -0,0 +1,95 @@
+"""
+Worker persistente de yt-dlp
+Importa yt-dlp una sola vez y ejecuta trabajos recibidos por stdin
+
+Protocolo (una línea JSON por mensaje):
+    entrada: {"args": [...]}                       argumentos de línea de comandos de yt-dlp
+    salida:  {"stream": "out"|"err", "line": "..."} cada línea que yt-dlp escribe
+             {"returncode": 0}                       fin del trabajo
+"""
+
+import io
+import json
+import sys
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+
+import yt_dlp
+
+
+def _send(channel, message: dict):
+    channel.write(json.dumps(message) + "\n")
+    channel.flush()
+
+
+class _LineWriter(io.TextIOBase):
+    """Archivo de texto que reenvía cada línea escrita al proceso padre"""
+
+    encoding = "utf-8"
+
+    def __init__(self, channel, stream: str):
+        super().__init__()
+        self._channel = channel
+        self._stream = stream
+        self._pending = ""
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        return False
+
+    def write(self, text: str) -> int:
+        # Las barras de progreso usan \r en lugar de \n
+        *lines, self._pending = (self._pending + text).replace("\r", "\n").split("\n")
+        for line in lines:
+            if line:
+                _send(self._channel, {"stream": self._stream, "line": line})
+        return len(text)
+
+    def close(self):
+        if self._pending:
+            _send(self._channel, {"stream": self._stream, "line": self._pending})
+            self._pending = ""
+        super().close()
+
+
+def _run_job(args: list) -> int:
+    """Ejecutar yt-dlp con los argumentos dados y devolver el código de salida"""
+    try:
+        yt_dlp.main(args)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        # yt-dlp sale con el mensaje de error como código
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def main():
+    channel = sys.stdout
+
+    for raw in sys.stdin:
+        if not raw.strip():
+            continue
+
+        job = json.loads(raw)
+        out = _LineWriter(channel, "out")
+        err = _LineWriter(channel, "err")
+
+        with redirect_stdout(out), redirect_stderr(err):
+            returncode = _run_job(job["args"])
+
+        out.close()
+        err.close()
+        _send(channel, {"returncode": returncode})
+
+
+if __name__ == "__main__":
+    main()
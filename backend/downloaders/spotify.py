@@ -4,37 +4,48 @@ Busca la canción en YouTube y la descarga
 """
 
 import os
-import subprocess
+import asyncio
 import re
 import httpx
+import orjson
 import traceback
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-from datetime import datetime
+from typing import Callable, Optional
+
+from ._cache import async_ttl_cache
+from ._http import shared_client
+from ._naming import unique_suffix
+from ._track_cache import TrackCache
+from .ytdlp_pool import YtDlpPool, run_ytdlp
+
+# Patrones precompilados
+_TRACK_ID_RE = re.compile(r'track/([a-zA-Z0-9]+)')
+_UNSAFE_CHARS_RE = re.compile(r'\W+')  # Todo lo que no sea letra/número/_ (incluye espacios y guiones)
+_YOUTUBE_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+
+# Prefijos de las líneas --print (para no confundirlas con el resto de la salida)
+_VIDEO_ID_PREFIX = "video_id="
+_FILEPATH_PREFIX = "filepath="
 
 
 class SpotifyDownloader:
     """Descargador de Spotify usando yt-dlp (busca en YouTube)"""
     
-    def __init__(self, downloads_dir: Path):
+    def __init__(self, downloads_dir: Path, pool: Optional[YtDlpPool] = None):
         self.downloads_dir = downloads_dir
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
+        self._downloads_dir_str = str(self.downloads_dir)
+        self.pool = pool
+        self.track_cache = TrackCache(downloads_dir / ".spotify_cache.db")
     
+    @async_ttl_cache(ttl=600)
     async def _extract_track_info(self, url: str) -> dict:
         """Extraer información del track de Spotify via embed"""
         try:
             # Extraer ID del track - soporta varios formatos de URL
-            patterns = [
-                r'track/([a-zA-Z0-9]{22})',  # ID completo de 22 caracteres
-                r'track/([a-zA-Z0-9]+)',      # Cualquier ID
-            ]
-            
-            track_id = None
-            for pattern in patterns:
-                match = re.search(pattern, url)
-                if match:
-                    track_id = match.group(1)
-                    break
+            match = _TRACK_ID_RE.search(url)
+            track_id = match.group(1) if match else None
             
             if not track_id:
                 return {"success": False, "error": f"URL de Spotify inválida. No se encontró ID de track en: {url}"}
@@ -45,39 +56,40 @@ class SpotifyDownloader:
             oembed_url = f"https://open.spotify.com/oembed?url=https://open.spotify.com/track/{track_id}"
             print(f"[Spotify] Consultando oembed: {oembed_url}")
             
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.get(oembed_url)
+            client = await shared_client()
+            response = await client.get(oembed_url, timeout=15.0)
+            
+            print(f"[Spotify] Respuesta oembed: {response.status_code}")
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                
+                # El título viene como "Canción by Artista"
+                raw_title = data.get("title", "")
+                thumbnail = data.get("thumbnail_url", "")
+                
+                print(f"[Spotify] Raw title: {raw_title}")
+                print(f"[Spotify] Thumbnail: {thumbnail}")
+                
+                # Parsear título y artista (formato: "Canción by Artista")
+                song_title = raw_title
+                artist = ""
                 
-                print(f"[Spotify] Respuesta oembed: {response.status_code}")
+                if " by " in raw_title:
+                    parts = raw_title.split(" by ", 1)
+                    song_title = parts[0].strip()
+                    artist = parts[1].strip()
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # El título viene como "Canción by Artista"
-                    raw_title = data.get("title", "")
-                    thumbnail = data.get("thumbnail_url", "")
-                    
-                    print(f"[Spotify] Raw title: {raw_title}")
-                    print(f"[Spotify] Thumbnail: {thumbnail}")
-                    
-                    # Parsear título y artista (formato: "Canción by Artista")
-                    song_title = raw_title
-                    artist = ""
-                    
-                    if " by " in raw_title:
-                        parts = raw_title.split(" by ", 1)
-                        song_title = parts[0].strip()
-                        artist = parts[1].strip()
-                    
-                    return {
-                        "success": True,
-                        "title": song_title,
-                        "artist": artist,
-                        "thumbnail": thumbnail,
-                        "search_query": raw_title.replace(" by ", " - ")  # Para buscar en YouTube
-                    }
-                else:
-                    return {"success": False, "error": f"Spotify API error: {response.status_code}. Verifica que el link sea válido."}
+                return {
+                    "success": True,
+                    "track_id": track_id,
+                    "title": song_title,
+                    "artist": artist,
+                    "thumbnail": thumbnail,
+                    "search_query": raw_title.replace(" by ", " - ")  # Para buscar en YouTube
+                }
+            else:
+                return {"success": False, "error": f"Spotify API error: {response.status_code}. Verifica que el link sea válido."}
             
         except httpx.TimeoutException:
             return {"success": False, "error": "Timeout al conectar con Spotify. Intenta de nuevo."}
@@ -96,9 +108,16 @@ class SpotifyDownloader:
         }
         return quality_map.get(format, ["--audio-format", "mp3", "--audio-quality", "0", "--postprocessor-args", "ffmpeg:-threads 4"])
     
-    async def download(self, url: str, format: str = "mp3") -> dict:
+    async def download(
+        self,
+        url: str,
+        format: str = "mp3",
+        progress_callback: Optional[Callable[[float], None]] = None
+    ) -> dict:
         """
         Descargar track de Spotify (via YouTube search)
+        
+        progress_callback recibe el porcentaje de descarga (0-100)
         """
         try:
             print(f"[Spotify] Iniciando descarga: {url}")
@@ -111,73 +130,83 @@ class SpotifyDownloader:
                 return track_info
             
             search_query = track_info["search_query"]
-            print(f"[Spotify] Buscando en YouTube: {search_query}")
+            track_id = track_info["track_id"]
+            
+            # Si ya descargamos este track antes, ir directo al video (sin ytsearch)
+            cached_video_id = await self.track_cache.get(track_id)
+            if cached_video_id:
+                source = f"https://youtu.be/{cached_video_id}"
+                print(f"[Spotify] Video en cache: {source}")
+            else:
+                source = f"ytsearch1:{search_query}"
+                print(f"[Spotify] Buscando en YouTube: {search_query}")
             
             # Generar nombre de archivo
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_title = re.sub(r'[^\w\s-]', '', search_query)[:50]
-            safe_title = re.sub(r'[-\s]+', '_', safe_title).strip('_')
+            suffix = unique_suffix()
+            safe_title = _UNSAFE_CHARS_RE.sub('_', search_query)[:50].strip('_')
             
             if not safe_title:
-                safe_title = f"spotify_track_{timestamp}"
+                safe_title = f"spotify_track_{suffix}"
             
-            output_template = str(self.downloads_dir / f"{safe_title}_{timestamp}.%(ext)s")
+            output_template = os.path.join(self._downloads_dir_str, f"{safe_title}_{suffix}.%(ext)s")
             print(f"[Spotify] Output template: {output_template}")
             
             format_opts = self._get_format_options(format)
             
-            # Buscar y descargar usando yt-dlp con ytsearch
-            cmd = [
-                "yt-dlp",
-                f"ytsearch1:{search_query}",
+            # Buscar y descargar usando yt-dlp (ytsearch o video en cache)
+            args = [
+                source,
                 "-x",
                 *format_opts,
                 "-o", output_template,
+                "--print", f"after_move:{_VIDEO_ID_PREFIX}%(id)s",  # ID del video elegido (para el cache)
+                "--print", f"after_move:{_FILEPATH_PREFIX}%(filepath)s",  # Ruta final del archivo
+                "--progress", "--newline",  # Progreso línea por línea (--print implica --quiet)
                 "--no-playlist",
                 "--no-warnings",
                 "--concurrent-fragments", "10",
                 "--no-call-home",
                 "--no-check-certificate",
-                "--buffer-size", "16K",
+                "--http-chunk-size", "10M",  # Chunks grandes evitan el throttling por chunk
             ]
             
-            print(f"[Spotify] Ejecutando: {' '.join(cmd)}")
+            print(f"[Spotify] Ejecutando: yt-dlp {' '.join(args)}")
             
-            # Ejecutar yt-dlp con subprocess.run (sincrono pero confiable en Windows)
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=120  # 2 minutos max
+            # Ejecutar yt-dlp sin bloquear el event loop
+            returncode, output = await run_ytdlp(
+                args, timeout=120, pool=self.pool, progress_callback=progress_callback  # 2 minutos max
             )
             
-            stdout_text = result.stdout
-            stderr_text = result.stderr
-            
-            print(f"[Spotify] yt-dlp returncode: {result.returncode}")
-            print(f"[Spotify] stdout: {stdout_text[:500] if stdout_text else 'empty'}")
-            print(f"[Spotify] stderr: {stderr_text[:500] if stderr_text else 'empty'}")
+            print(f"[Spotify] yt-dlp returncode: {returncode}")
+            print(f"[Spotify] output: {output[-500:] if output else 'empty'}")
             
-            if result.returncode != 0:
-                error_msg = stderr_text or stdout_text or "Error desconocido en yt-dlp"
+            if returncode != 0:
+                if cached_video_id:
+                    # El video pudo haber sido eliminado: buscar de nuevo la próxima vez
+                    await self.track_cache.delete(track_id)
+                error_msg = output or "Error desconocido en yt-dlp"
                 return {
                     "success": False,
-                    "error": f"Error al descargar: {error_msg[:200]}"
+                    "error": f"Error al descargar: {error_msg[-200:]}"
                 }
             
-            # Buscar archivo descargado
-            downloaded_files = list(self.downloads_dir.glob(f"{safe_title}_{timestamp}.*"))
-            
-            if not downloaded_files:
-                # Buscar cualquier archivo reciente del formato
-                all_files = list(self.downloads_dir.glob(f"*.{format}"))
-                if all_files:
-                    downloaded_files = [max(all_files, key=os.path.getctime)]
-            
-            if downloaded_files:
-                downloaded_file = downloaded_files[0]
+            # yt-dlp imprime el ID del video y la ruta final del archivo (con sus prefijos)
+            video_id = filepath = None
+            for line in output.splitlines():
+                line = line.strip()
+                if line.startswith(_VIDEO_ID_PREFIX):
+                    video_id = line[len(_VIDEO_ID_PREFIX):]
+                elif line.startswith(_FILEPATH_PREFIX):
+                    filepath = line[len(_FILEPATH_PREFIX):]
+            
+            if filepath:
+                downloaded_file = Path(filepath)
                 print(f"[Spotify] Archivo descargado: {downloaded_file}")
                 
+                # Solo cachear un ID de YouTube válido (11 caracteres)
+                if not cached_video_id and video_id and _YOUTUBE_ID_RE.fullmatch(video_id):
+                    await self.track_cache.set(track_id, video_id)
+                
                 parts = search_query.split(" - ", 1) if " - " in search_query else [search_query, "Unknown"]
                 
                 return {
@@ -193,7 +222,7 @@ class SpotifyDownloader:
                 "error": "No se encontró el archivo descargado después de la conversión"
             }
             
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             return {
                 "success": False,
                 "error": "Timeout: la descarga tardó demasiado"
@@ -217,3 +246,9 @@ class SpotifyDownloader:
     async def get_info(self, url: str) -> dict:
         """Obtener información del track sin descargar"""
         return await self._extract_track_info(url)
+
+
+@lru_cache(maxsize=16)
+def get_spotify_downloader(downloads_dir: str, pool: Optional[YtDlpPool] = None) -> SpotifyDownloader:
+    """Obtener el SpotifyDownloader compartido para un directorio de descargas"""
+    return SpotifyDownloader(Path(downloads_dir), pool=pool)
@@ -5,12 +5,21 @@ Descarga videos de TikTok sin marca de agua
 
 import os
 import asyncio
-import httpx
 import re
 import json
+import aiofiles
+import orjson
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
-from datetime import datetime
+
+from ._cache import async_ttl_cache
+from ._http import shared_client
+from ._naming import unique_suffix
+
+# Patrones precompilados
+_TIKTOK_ID_RE = re.compile(r'(?:tiktok\.com/@[\w.-]+/video/|/video/|tiktok\.com/t/|vm\.tiktok\.com/)(\w+)')
+_UNSAFE_CHARS_RE = re.compile(r'\W+')  # Todo lo que no sea letra/número/_ (incluye espacios y guiones)
 
 
 class TikTokDownloader:
@@ -19,6 +28,7 @@ class TikTokDownloader:
     def __init__(self, downloads_dir: Path):
         self.downloads_dir = downloads_dir
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
+        self._downloads_dir_str = str(self.downloads_dir)
         
         # APIs públicas para descarga sin watermark
         self.api_endpoints = [
@@ -26,64 +36,59 @@ class TikTokDownloader:
             "https://api.tikmate.app/api/lookup",
         ]
         
+        # Consultas que siguen en segundo plano tras get_info (referencia fuerte para el GC)
+        self._background: set = set()
+        
     def _extract_video_id(self, url: str) -> Optional[str]:
         """Extraer ID del video de una URL de TikTok"""
-        patterns = [
-            r'tiktok\.com/@[\w.-]+/video/(\d+)',
-            r'tiktok\.com/t/(\w+)',
-            r'vm\.tiktok\.com/(\w+)',
-            r'/video/(\d+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-        
-        return None
+        match = _TIKTOK_ID_RE.search(url)
+        return match.group(1) if match else None
     
+    @async_ttl_cache(ttl=600)
     async def _get_video_info_tikwm(self, url: str) -> dict:
         """Obtener info del video usando tikwm API"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    "https://www.tikwm.com/api/",
-                    data={"url": url, "hd": 1}
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("code") == 0:
-                        video_data = data.get("data", {})
-                        return {
-                            "success": True,
-                            "video_url": video_data.get("play"),  # Sin watermark
-                            "audio_url": video_data.get("music"),
-                            "title": video_data.get("title", "TikTok Video"),
-                            "author": video_data.get("author", {}).get("nickname"),
-                            "cover": video_data.get("cover"),
-                            "duration": video_data.get("duration")
-                        }
-                
-                return {"success": False, "error": "API tikwm no respondió correctamente"}
-                
+            client = await shared_client()
+            response = await client.post(
+                "https://www.tikwm.com/api/",
+                data={"url": url, "hd": 1},
+                timeout=30.0
+            )
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                if data.get("code") == 0:
+                    video_data = data.get("data", {})
+                    return {
+                        "success": True,
+                        "video_url": video_data.get("play"),  # Sin watermark
+                        "audio_url": video_data.get("music"),
+                        "title": video_data.get("title", "TikTok Video"),
+                        "author": video_data.get("author", {}).get("nickname"),
+                        "cover": video_data.get("cover"),
+                        "duration": video_data.get("duration")
+                    }
+            
+            return {"success": False, "error": "API tikwm no respondió correctamente"}
+            
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    async def _download_file(self, url: str, output_path: Path) -> bool:
+    async def _download_file(self, url: str, output_path: str) -> bool:
         """Descargar archivo desde URL de forma optimizada con streaming"""
         try:
             print(f"[TikTok] Descargando desde: {url[:50]}...")
-            async with httpx.AsyncClient(timeout=120.0, follow_redirects=True) as client:
-                async with client.stream("GET", url) as response:
-                    if response.status_code == 200:
-                        with open(output_path, 'wb') as f:
-                            async for chunk in response.aiter_bytes(chunk_size=32768): # Buffer de 32KB
-                                if chunk:
-                                    f.write(chunk)
-                        return True
-                    else:
-                        print(f"[TikTok] Error en descarga: status {response.status_code}")
+            client = await shared_client()
+            async with client.stream("GET", url, headers={"Accept": "*/*"}, timeout=120.0, follow_redirects=True) as response:
+                if response.status_code == 200:
+                    # Escritura async para no bloquear el event loop con I/O de disco
+                    async with aiofiles.open(output_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes(chunk_size=1 << 20): # Buffer de 1MB
+                            if chunk:
+                                await f.write(chunk)
+                    return True
+                else:
+                    print(f"[TikTok] Error en descarga: status {response.status_code}")
                 
             return False
         except Exception as e:
@@ -126,20 +131,19 @@ class TikTokDownloader:
                 }
             
             # Generar nombre de archivo único
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_title = re.sub(r'[^\w\s-]', '', info.get("title", "tiktok")[:50])
-            safe_title = re.sub(r'[-\s]+', '_', safe_title).strip('_')
+            suffix = unique_suffix()
+            safe_title = _UNSAFE_CHARS_RE.sub('_', info.get("title", "tiktok"))[:50].strip('_')
             
-            filename = f"tiktok_{safe_title}_{timestamp}.{extension}"
-            output_path = self.downloads_dir / filename
+            filename = f"tiktok_{safe_title}_{suffix}.{extension}"
+            output_path = os.path.join(self._downloads_dir_str, filename)
             
             # Descargar archivo
             success = await self._download_file(download_url, output_path)
             
-            if success and output_path.exists():
+            if success:
                 return {
                     "success": True,
-                    "file_path": str(output_path),
+                    "file_path": output_path,
                     "filename": filename,
                     "title": info.get("title"),
                     "author": info.get("author")
@@ -156,33 +160,62 @@ class TikTokDownloader:
                 "error": str(e)
             }
     
-    async def get_info(self, url: str) -> dict:
-        """Obtener información del video de TikTok vía oEmbed (rápido para previews)"""
+    async def _get_oembed(self, url: str) -> dict:
+        """Obtener información del video vía oEmbed de TikTok"""
         try:
-            # TikTok oEmbed API
             oembed_url = f"https://www.tiktok.com/oembed?url={url}"
             print(f"[TikTok] Consultando oEmbed: {oembed_url}")
             
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(oembed_url)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "success": True,
-                        "title": data.get("title", "TikTok Video"),
-                        "author": data.get("author_name", "TikTok Creator"),
-                        "cover": data.get("thumbnail_url"),
-                        "thumbnail": data.get("thumbnail_url"),
-                        "duration": None
-                    }
+            client = await shared_client()
+            response = await client.get(oembed_url, timeout=10.0)
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                return {
+                    "success": True,
+                    "title": data.get("title", "TikTok Video"),
+                    "author": data.get("author_name", "TikTok Creator"),
+                    "cover": data.get("thumbnail_url"),
+                    "thumbnail": data.get("thumbnail_url"),
+                    "duration": None
+                }
             
-            # Fallback a tikwm si oEmbed falla
-            return await self._get_video_info_tikwm(url)
+            return {"success": False, "error": f"oEmbed respondió {response.status_code}"}
         except Exception as e:
-            print(f"[TikTok] Error en oEmbed: {str(e)}, usando fallback...")
-            return await self._get_video_info_tikwm(url)
+            print(f"[TikTok] Error en oEmbed: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    @async_ttl_cache(ttl=600)
+    async def get_info(self, url: str) -> dict:
+        """Obtener información del video de TikTok (oEmbed y tikwm en paralelo, gana el primero que responda)"""
+        oembed_task = asyncio.create_task(self._get_oembed(url))
+        tikwm_task = asyncio.create_task(self._get_video_info_tikwm(url))
+        
+        pending = {oembed_task, tikwm_task}
+        result = {"success": False, "error": "No se pudo obtener información del video"}
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.get("success"):
+                        return result
+            
+            return result
+        finally:
+            # No cancelar la consulta que perdió: tikwm trae la URL sin watermark y,
+            # al quedar en su caché, la descarga posterior no repite la petición
+            for task in pending:
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
 
     async def download_audio_only(self, url: str) -> dict:
         """Descargar solo el audio del TikTok"""
         return await self.download(url, format="mp3")
+
+
+@lru_cache(maxsize=16)
+def get_tiktok_downloader(downloads_dir: str) -> TikTokDownloader:
+    """Obtener el TikTokDownloader compartido para un directorio de descargas"""
+    return TikTokDownloader(Path(downloads_dir))
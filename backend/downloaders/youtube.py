@@ -1,29 +1,64 @@
 """
 YouTube Downloader using yt-dlp
 Soporta videos individuales y playlists
-Corregido para Windows: usa subprocess.run en lugar de asyncio.create_subprocess_exec
+Ejecuta yt-dlp de forma asíncrona para no bloquear el event loop
 """
 
 import os
-import subprocess
-import json
+import asyncio
+import threading
 import traceback
+import orjson
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-from datetime import datetime
-import re
+from typing import Callable, Optional
 
+from yt_dlp import YoutubeDL
 
-import httpx
+from ._cache import async_ttl_cache
+from ._http import shared_client
+from ._naming import unique_suffix
+from .ytdlp_pool import YtDlpPool, run_ytdlp
+
+# Prefijo de la línea --print con la ruta final (para no confundirla con el resto de la salida)
+_FILEPATH_PREFIX = "filepath="
 
 class YouTubeDownloader:
     """Descargador de YouTube usando yt-dlp"""
     
-    def __init__(self, downloads_dir: Path):
+    def __init__(self, downloads_dir: Path, pool: Optional[YtDlpPool] = None):
         self.downloads_dir = downloads_dir
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self._downloads_dir_str = str(self.downloads_dir)
+        self.pool = pool
+        
+        # yt-dlp en proceso para consultas de metadata: YoutubeDL no es thread-safe,
+        # así que se reutiliza una instancia por thread
+        self._ydl_local = threading.local()
+    
+    def _thread_ydl(self) -> YoutubeDL:
+        """YoutubeDL del thread actual (se crea en el primer uso)"""
+        ydl = getattr(self._ydl_local, "ydl", None)
+        if ydl is None:
+            ydl = self._ydl_local.ydl = YoutubeDL({
+                "quiet": True,
+                "no_warnings": True,
+                "skip_download": True,
+                "extract_flat": "in_playlist",
+            })
+        return ydl
+    
+    def _extract_info_sync(self, url: str) -> dict:
+        return self._thread_ydl().extract_info(url, download=False)
+    
+    async def _extract_info(self, url: str, timeout: float) -> dict:
+        """Extraer metadata con yt-dlp en un thread (sin lanzar un proceso nuevo)"""
+        return await asyncio.wait_for(
+            asyncio.to_thread(self._extract_info_sync, url),
+            timeout=timeout
+        )
     
+    @async_ttl_cache(ttl=600)
     async def get_info(self, url: str) -> dict:
         """Obtener información del video de forma instantánea usando oEmbed"""
         try:
@@ -31,10 +66,11 @@ class YouTubeDownloader:
             oembed_url = f"https://www.youtube.com/oembed?url={url}&format=json"
             print(f"[YouTube] Consultando oEmbed: {oembed_url}")
             
-            response = await self.client.get(oembed_url)
+            client = await shared_client()
+            response = await client.get(oembed_url, timeout=10.0)
             
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content)
                 return {
                     "success": True,
                     "title": data.get("title"),
@@ -54,17 +90,8 @@ class YouTubeDownloader:
     async def _get_info_fallback(self, url: str) -> dict:
         """Método de respaldo usando yt-dlp"""
         try:
-            cmd = [
-                "yt-dlp",
-                "--dump-json",
-                "--no-download",
-                "--no-warnings",
-                "--flat-playlist",
-                url
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=20)
-            if result.returncode == 0 and result.stdout:
-                info = json.loads(result.stdout)
+            info = await self._extract_info(url, timeout=20)
+            if info:
                 return {
                     "success": True,
                     "title": info.get("title"),
@@ -74,6 +101,7 @@ class YouTubeDownloader:
             return {"success": False, "error": "No se pudo obtener información"}
         except Exception as e:
             return {"success": False, "error": str(e)}
+    
     def _get_format_options(self, format: str, quality: str) -> list:
         """Obtener opciones de yt-dlp según formato y calidad"""
         
@@ -92,21 +120,30 @@ class YouTubeDownloader:
                 "--audio-format", format,
                 "--audio-quality", audio_quality,
                 "--postprocessor-args", "ffmpeg:-threads 4",
+                "--extractor-args", "youtube:player_client=ios,web_safari,android",  # ios: audio m4a directo
             ]
         elif format == "mp4":
             return [
                 "-f", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
                 "--merge-output-format", "mp4",
                 "--postprocessor-args", "ffmpeg:-threads 4",
+                "--extractor-args", "youtube:player_client=web_safari,ios,android",
             ]
         else:
             return [
                 "-x",
                 "--audio-format", "mp3",
                 "--audio-quality", "192",
+                "--extractor-args", "youtube:player_client=ios,web_safari,android",
             ]
     
-    async def download(self, url: str, format: str = "mp3", quality: str = "320k") -> dict:
+    async def download(
+        self,
+        url: str,
+        format: str = "mp3",
+        quality: str = "320k",
+        progress_callback: Optional[Callable[[float], None]] = None
+    ) -> dict:
         """
         Descargar video/audio de YouTube
         
@@ -114,6 +151,7 @@ class YouTubeDownloader:
             url: URL del video o playlist de YouTube
             format: Formato de salida (mp3, m4a, wav, flac, mp4)
             quality: Calidad de audio (128k, 192k, 320k)
+            progress_callback: Callback opcional con el porcentaje de descarga (0-100)
         
         Returns:
             dict con success, file_path, filename, title, duration
@@ -122,66 +160,59 @@ class YouTubeDownloader:
             print(f"[YouTube] Iniciando descarga: {url}")
             
             # Generar nombre único para evitar conflictos
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_template = str(self.downloads_dir / f"%(title)s_{timestamp}.%(ext)s")
+            suffix = unique_suffix()
+            output_template = os.path.join(self._downloads_dir_str, f"%(title)s_{suffix}.%(ext)s")
             
             format_opts = self._get_format_options(format, quality)
             
-            cmd = [
-                "yt-dlp",
+            args = [
                 "--no-playlist",
                 "-o", output_template,
+                "--print", f"after_move:{_FILEPATH_PREFIX}%(filepath)s",  # Ruta final del archivo
+                "--progress", "--newline",  # Progreso línea por línea (--print implica --quiet)
                 "--restrict-filenames",
                 "--no-overwrites",
                 "--no-warnings",
                 "--concurrent-fragments", "10",  # Descarga multihilo
                 "--no-check-certificate",
-                "--buffer-size", "16K",
+                "--http-chunk-size", "10M",  # Chunks grandes evitan el throttling por chunk
                 "--geo-bypass",
-                "--extractor-args", "youtube:player_client=android",  # Bypass 403
                 "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             ] + format_opts + [url]
             
-            print(f"[YouTube] Comando: {' '.join(cmd)}")
+            print(f"[YouTube] Comando: yt-dlp {' '.join(args)}")
             
-            # Ejecutar yt-dlp con subprocess.run (síncrono pero confiable en Windows)
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minutos max
+            # Ejecutar yt-dlp sin bloquear el event loop
+            returncode, output = await run_ytdlp(
+                args, timeout=300, pool=self.pool, progress_callback=progress_callback  # 5 minutos max
             )
             
-            print(f"[YouTube] Return code: {result.returncode}")
-            print(f"[YouTube] stdout: {result.stdout[:500] if result.stdout else 'empty'}")
-            print(f"[YouTube] stderr: {result.stderr[:500] if result.stderr else 'empty'}")
+            print(f"[YouTube] Return code: {returncode}")
+            print(f"[YouTube] output: {output[-500:] if output else 'empty'}")
             
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "Error desconocido"
+            if returncode != 0:
+                error_msg = output or "Error desconocido"
                 return {
                     "success": False,
-                    "error": f"Error de yt-dlp: {error_msg[:300]}"
+                    "error": f"Error de yt-dlp: {error_msg[-300:]}"
                 }
             
-            # Buscar el archivo descargado más reciente
-            pattern = f"*_{timestamp}.*"
-            downloaded_files = list(self.downloads_dir.glob(pattern))
-            
-            if not downloaded_files:
-                # Buscar cualquier archivo reciente
-                all_files = list(self.downloads_dir.glob(f"*.{format}"))
-                if all_files:
-                    downloaded_files = [max(all_files, key=os.path.getctime)]
+            # yt-dlp imprime la ruta final del archivo (con su prefijo)
+            filepath = None
+            for line in output.splitlines():
+                line = line.strip()
+                if line.startswith(_FILEPATH_PREFIX):
+                    filepath = line[len(_FILEPATH_PREFIX):]
             
-            if downloaded_files:
-                latest_file = downloaded_files[0]
+            latest_file = Path(filepath) if filepath else None
+            if latest_file is not None and latest_file.is_file():
                 print(f"[YouTube] Archivo descargado: {latest_file}")
                 
                 return {
                     "success": True,
                     "file_path": str(latest_file),
                     "filename": latest_file.name,
-                    "title": latest_file.stem.replace(f"_{timestamp}", ""),
+                    "title": latest_file.stem.replace(f"_{suffix}", ""),
                     "duration": None
                 }
             
@@ -190,7 +221,7 @@ class YouTubeDownloader:
                 "error": "No se encontró el archivo descargado"
             }
             
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             return {
                 "success": False,
                 "error": "Timeout: la descarga tardó demasiado (más de 5 minutos)"
@@ -209,42 +240,64 @@ class YouTubeDownloader:
                 "error": f"Error inesperado: {str(e)}"
             }
     
-    async def download_playlist(self, url: str, format: str = "mp3", quality: str = "320k") -> dict:
-        """Descargar playlist completa de YouTube"""
+    async def _list_playlist_ids(self, url: str) -> list:
+        """Obtener los IDs de los videos de una playlist sin descargarlos"""
+        info = await self._extract_info(url, timeout=120)
+        entries = info.get("entries") or []
+        return [entry["id"] for entry in entries if entry and entry.get("id")]
+    
+    async def _download_one(self, url: str, format: str, quality: str, sem: asyncio.Semaphore) -> dict:
+        """Descargar un video de la playlist respetando el límite de concurrencia"""
+        async with sem:
+            result = await self.download(url, format, quality)
+        result["url"] = url
+        return result
+    
+    async def download_playlist(self, url: str, format: str = "mp3", quality: str = "320k", concurrency: int = 5) -> dict:
+        """
+        Descargar playlist completa de YouTube
+        
+        Lista primero los videos y luego los descarga en paralelo (máximo `concurrency` a la vez)
+        
+        Returns:
+            dict con success, message y results (resultado de cada video)
+        """
         try:
-            output_template = str(self.downloads_dir / "%(playlist_title)s/%(title)s.%(ext)s")
+            video_ids = await self._list_playlist_ids(url)
             
-            format_opts = self._get_format_options(format, quality)
-            
-            cmd = [
-                "yt-dlp",
-                "--yes-playlist",
-                "-o", output_template,
-                "--restrict-filenames",
-                "--no-overwrites",
-            ] + format_opts + [url]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=1800  # 30 minutos para playlists
-            )
-            
-            if result.returncode != 0:
+            if not video_ids:
                 return {
                     "success": False,
-                    "error": result.stderr or "Error desconocido"
+                    "error": "La playlist está vacía"
                 }
             
+            sem = asyncio.Semaphore(concurrency)
+            results = await asyncio.gather(*(
+                self._download_one(f"https://youtu.be/{video_id}", format, quality, sem)
+                for video_id in video_ids
+            ))
+            
+            completed = sum(1 for r in results if r.get("success"))
+            
             return {
-                "success": True,
-                "message": "Playlist descargada correctamente"
+                "success": completed > 0,
+                "message": f"{completed}/{len(results)} videos descargados",
+                "results": results
             }
             
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "error": "Timeout: no se pudo leer la playlist"
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
-    
+
+
+@lru_cache(maxsize=16)
+def get_youtube_downloader(downloads_dir: str, pool: Optional[YtDlpPool] = None) -> YouTubeDownloader:
+    """Obtener el YouTubeDownloader compartido para un directorio de descargas"""
+    return YouTubeDownloader(Path(downloads_dir), pool=pool)
@@ -0,0 +1,214 @@
+"""
+Pool de procesos yt-dlp reutilizables
+Evita pagar el arranque del intérprete + import de yt-dlp en cada descarga
+"""
+
+import asyncio
+import json
+import re
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from ._process import OUTPUT_TAIL_LINES, run_command
+
+WORKER_SCRIPT = Path(__file__).with_name("_ytdlp_worker.py")
+
+# Línea de progreso de yt-dlp con --newline: "[download]  42.3% of ..."
+_PROGRESS_RE = re.compile(r'^\[download\]\s+(\d+(?:\.\d+)?)%')
+
+
+class PooledProcess:
+    """Proceso worker de yt-dlp que acepta trabajos por stdin"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def run(self, args: List[str], on_line: Optional[Callable[[str], None]] = None) -> Tuple[int, str]:
+        """Enviar un trabajo al worker y esperar a que termine"""
+        self.uses += 1
+        self.process.stdin.write(json.dumps({"args": args}).encode() + b"\n")
+        await self.process.stdin.drain()
+
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+
+        while True:
+            raw = await self.process.stdout.readline()
+            if not raw:
+                raise RuntimeError("El worker de yt-dlp terminó inesperadamente")
+
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                # Salida ajena al protocolo (p. ej. ffmpeg escribiendo directo al fd)
+                continue
+
+            if "returncode" in message:
+                break
+
+            line = message["line"]
+            tail.append(line)
+            if on_line:
+                on_line(line)
+
+        self.last_used = time.monotonic()
+        return message["returncode"], "\n".join(tail)
+
+    async def terminate(self, kill: bool = False):
+        """Cerrar el worker (kill=True si está en medio de un trabajo)"""
+        if not self.alive:
+            return
+
+        if kill:
+            self.process.kill()
+        else:
+            self.process.stdin.close()
+
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+class YtDlpPool:
+    """Pool de workers yt-dlp con límite de procesos, reciclaje y timeout de inactividad"""
+
+    def __init__(self, max_processes: int = 4, max_process_uses: int = 100, idle_timeout: float = 300.0):
+        self.max_processes = max_processes
+        self.max_process_uses = max_process_uses
+        self.idle_timeout = idle_timeout
+
+        self._idle: List[PooledProcess] = []
+        self._active: List[PooledProcess] = []
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_processes)
+
+    async def _spawn(self) -> PooledProcess:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, str(WORKER_SCRIPT),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=1024 * 1024
+        )
+        return PooledProcess(process)
+
+    async def acquire(self) -> PooledProcess:
+        """Obtener un worker libre (reutiliza uno inactivo o crea uno nuevo)"""
+        await self._slots.acquire()
+        try:
+            now = time.monotonic()
+            stale = []
+            proc = None
+
+            async with self._lock:
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if candidate.alive and now - candidate.last_used < self.idle_timeout:
+                        proc = candidate
+                        break
+                    stale.append(candidate)
+
+            for old in stale:
+                await old.terminate()
+
+            if proc is None:
+                proc = await self._spawn()
+
+            async with self._lock:
+                self._active.append(proc)
+            return proc
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, proc: PooledProcess, discard: bool = False):
+        """Devolver un worker al pool (o cerrarlo si se debe reciclar)"""
+        async with self._lock:
+            self._active.remove(proc)
+            recycle = discard or not proc.alive or proc.uses >= self.max_process_uses
+            if not recycle:
+                self._idle.append(proc)
+
+        self._slots.release()
+
+        if recycle:
+            await proc.terminate(kill=discard)
+
+    async def run(
+        self,
+        args: List[str],
+        timeout: float,
+        on_line: Optional[Callable[[str], None]] = None
+    ) -> Tuple[int, str]:
+        """
+        Ejecutar yt-dlp con los argumentos dados en un worker del pool
+
+        Returns:
+            tupla (returncode, últimas líneas de salida)
+
+        Raises:
+            asyncio.TimeoutError: si el trabajo excede el timeout (el worker se descarta)
+        """
+        try:
+            proc = await self.acquire()
+        except NotImplementedError:
+            # El event loop no soporta subprocesos con pipes: usar la ruta de un solo uso
+            return await run_command(["yt-dlp", *args], timeout, on_line)
+
+        discard = False
+        try:
+            return await asyncio.wait_for(proc.run(args, on_line), timeout=timeout)
+        except BaseException:
+            # Timeout, cancelación o error: el worker queda en estado desconocido
+            discard = True
+            raise
+        finally:
+            await self.release(proc, discard=discard)
+
+    async def close(self):
+        """Cerrar todos los workers del pool"""
+        async with self._lock:
+            procs = self._idle + self._active
+            self._idle = []
+
+        for proc in procs:
+            await proc.terminate(kill=True)
+
+
+async def run_ytdlp(
+    args: List[str],
+    timeout: float,
+    pool: Optional[YtDlpPool] = None,
+    progress_callback: Optional[Callable[[float], None]] = None
+) -> Tuple[int, str]:
+    """
+    Ejecutar yt-dlp en el pool si existe, o como proceso de un solo uso
+
+    Args:
+        args: Argumentos de yt-dlp
+        timeout: Tiempo máximo en segundos
+        pool: Pool de workers (None = proceso nuevo)
+        progress_callback: Callback opcional con el porcentaje de descarga (0-100)
+
+    Returns:
+        tupla (returncode, últimas líneas de salida)
+    """
+    on_line = None
+    if progress_callback:
+        def on_line(line: str):
+            match = _PROGRESS_RE.match(line)
+            if match:
+                progress_callback(float(match.group(1)))
+
+    if pool:
+        return await pool.run(args, timeout, on_line)
+    return await run_command(["yt-dlp", *args], timeout, on_line)
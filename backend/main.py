@@ -5,29 +5,39 @@ Production-ready with environment variables and rate limiting
 """
 
 import os
-import uuid
+import secrets
 import asyncio
 import traceback
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Awaitable, Callable, Optional, Dict
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, deque
 
+import aiodbm
+import orjson
+from aiodiskqueue import Queue as DiskQueue, QueueFull
+from aiodiskqueue.engines import DbmEngine
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel, HttpUrl
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 from starlette.middleware.base import BaseHTTPMiddleware
 
 # Load environment variables
 load_dotenv()
 
-from downloaders.youtube import YouTubeDownloader
-from downloaders.spotify import SpotifyDownloader
-from downloaders.tiktok import TikTokDownloader
+from downloaders.youtube import get_youtube_downloader
+from downloaders.spotify import get_spotify_downloader
+from downloaders.tiktok import get_tiktok_downloader
+from downloaders.ytdlp_pool import YtDlpPool
+from downloaders._http import close_shared_client
 from services.agent import MediaAgent
+from services.task_store import TaskStore
 
 # ==================== CONFIGURATION ====================
 
@@ -56,17 +66,122 @@ else:
 RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
 RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
 
+# Redis (estado compartido entre workers; vacío = solo en memoria)
+REDIS_URL = os.getenv("REDIS_URL", "")
+REDIS_TIMEOUT = 0.5  # Segundos (conexión y comandos); un Redis caído no debe colgar requests
+REDIS_RETRY_AFTER = 30  # Segundos sin consultar Redis tras un error (rate limiter)
+redis_client: Optional[Redis] = Redis.from_url(
+    REDIS_URL,
+    socket_connect_timeout=REDIS_TIMEOUT,
+    socket_timeout=REDIS_TIMEOUT,
+) if REDIS_URL else None
+
+# yt-dlp Worker Pool (0 = lanzar un proceso nuevo por descarga)
+YTDLP_POOL_SIZE = int(os.getenv("YTDLP_POOL_SIZE", "4"))
+
+# Download Workers (descargas simultáneas y tamaño máximo de la cola)
+DL_WORKERS = int(os.getenv("DL_WORKERS", "4"))
+DL_QUEUE_SIZE = 256
+DL_PLATFORM_CONCURRENCY = 2  # Descargas simultáneas por plataforma (evita 429 upstream)
+
+# Limpieza periódica de tareas vencidas (segundos)
+TASK_REAP_INTERVAL = 300
+
+
+# ==================== RESPONSES ====================
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse serializada con orjson (para endpoints que devuelven dicts)"""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+class LargeFileResponse(FileResponse):
+    """FileResponse con chunks de 1 MiB (menos lecturas en el threadpool para archivos grandes)"""
+    
+    chunk_size = 1024 * 1024
+
 
 # ==================== RATE LIMITING MIDDLEWARE ====================
 
+# Ventana deslizante atómica sobre un ZSET (score = timestamp en ms)
+# Devuelve los requests restantes, o -1 si se excedió el límite
+RATE_LIMIT_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+if count >= limit then
+    return -1
+end
+
+redis.call('ZADD', key, now, ARGV[4])
+redis.call('PEXPIRE', key, window)
+return limit - count - 1
+"""
+
 class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, requests_limit: int = 100, window: int = 60):
+    # Reapers de todas las instancias (Starlette crea el middleware, no la app):
+    # el lifespan los cancela al apagar
+    reapers: set = set()
+    
+    def __init__(self, app, requests_limit: int = 100, window: int = 60, redis: Optional[Redis] = None):
         super().__init__(app)
         self.requests_limit = requests_limit
         self.window = window
-        self.requests: Dict[str, list] = defaultdict(list)
+        # Timestamps (monotónicos) de requests por IP, del más viejo al más nuevo
+        # (se usa si no hay Redis o si Redis no responde)
+        self.requests: Dict[str, deque] = defaultdict(deque)
+        self._reaper: Optional[asyncio.Task] = None
+        self._script = redis.register_script(RATE_LIMIT_LUA) if redis else None
+        # Hasta cuándo (monotónico) saltarse Redis después de un error
+        self._redis_retry_at = 0.0
+    
+    async def _is_limited_redis(self, client_ip: str) -> bool:
+        """Registrar el request en Redis; True si la IP excedió el límite"""
+        now_ms = int(time.time() * 1000)
+        remaining = await self._script(
+            keys=[f"rl:{client_ip}"],
+            args=[now_ms, self.window * 1000, self.requests_limit, f"{now_ms}:{secrets.token_hex(4)}"]
+        )
+        return remaining < 0
+    
+    def _is_limited_local(self, client_ip: str) -> bool:
+        """Registrar el request en memoria; True si la IP excedió el límite"""
+        now = time.monotonic()
+        
+        # Clean old requests
+        q = self.requests[client_ip]
+        cutoff = now - self.window
+        while q and q[0] <= cutoff:
+            q.popleft()
+        
+        # Check rate limit
+        if len(q) >= self.requests_limit:
+            return True
+        
+        # Add current request
+        q.append(now)
+        return False
+    
+    async def _reap_idle_clients(self):
+        """Eliminar periódicamente las IPs sin requests dentro de la ventana"""
+        while True:
+            await asyncio.sleep(self.window)
+            cutoff = time.monotonic() - self.window
+            idle = [ip for ip, q in self.requests.items() if not q or q[-1] <= cutoff]
+            for ip in idle:
+                del self.requests[ip]
     
     async def dispatch(self, request: Request, call_next):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_idle_clients())
+            self.reapers.add(self._reaper)
+            self._reaper.add_done_callback(self.reapers.discard)
+        
         # Get client IP
         client_ip = request.client.host if request.client else "unknown"
         
@@ -74,39 +189,86 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         if request.url.path == "/health":
             return await call_next(request)
         
-        now = time.time()
+        limited = None
+        if self._script and time.monotonic() >= self._redis_retry_at:
+            try:
+                limited = await self._is_limited_redis(client_ip)
+            except (RedisError, OSError) as e:
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_AFTER
+                print(f"[RateLimit] Redis no disponible, usando límite en memoria por {REDIS_RETRY_AFTER}s: {str(e)}")
         
-        # Clean old requests
-        self.requests[client_ip] = [
-            req_time for req_time in self.requests[client_ip]
-            if now - req_time < self.window
-        ]
+        if limited is None:
+            limited = self._is_limited_local(client_ip)
         
-        # Check rate limit
-        if len(self.requests[client_ip]) >= self.requests_limit:
-            return JSONResponse(
+        if limited:
+            return ORJSONResponse(
                 status_code=429,
                 content={"detail": "Too many requests. Please try again later."}
             )
         
-        # Add current request
-        self.requests[client_ip].append(now)
-        
         return await call_next(request)
 
 
 # ==================== APP INITIALIZATION ====================
 
+ytdlp_pool = YtDlpPool(max_processes=YTDLP_POOL_SIZE) if YTDLP_POOL_SIZE > 0 else None
+
+# Cola de descargas persistente (sobrevive reinicios) consumida por DL_WORKERS workers
+download_queue: Optional[DiskQueue] = None
+# Jobs que un worker ya sacó de la cola y no terminó (task_id -> job): si el proceso
+# muere a mitad de una descarga, se vuelven a encolar al arrancar
+inflight_jobs: Optional[aiodbm.Database] = None
+platform_semaphores = {
+    platform: asyncio.Semaphore(DL_PLATFORM_CONCURRENCY)
+    for platform in ("youtube", "spotify", "tiktok")
+}
+# Descargas en curso por (plataforma, url, formato, ...) para no repetir descargas idénticas
+download_inflight: Dict[tuple, asyncio.Future] = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global download_queue, inflight_jobs
+    download_queue = await DiskQueue.create(
+        DOWNLOADS_DIR / "jobs.dbm",
+        maxsize=DL_QUEUE_SIZE,
+        cls_storage_engine=DbmEngine
+    )
+    inflight_jobs = await aiodbm.open(str(DOWNLOADS_DIR / "jobs-inflight.dbm"), "c")
+    await resume_pending_downloads()
+    
+    workers = [asyncio.create_task(download_worker()) for _ in range(DL_WORKERS)]
+    reaper = asyncio.create_task(task_reaper())
+    yield
+    # Shutdown: detener workers de descarga y reapers, cerrar workers de yt-dlp y conexiones HTTP
+    background_tasks = (*workers, reaper, *RateLimitMiddleware.reapers)
+    for background in background_tasks:
+        background.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await inflight_jobs.close()
+    if ytdlp_pool:
+        await ytdlp_pool.close()
+    await close_shared_client()
+    await spotify_dl.track_cache.close()
+    await media_agent.close()
+    if redis_client:
+        await redis_client.aclose()
+
 app = FastAPI(
     title="Media Downloader API",
     description="API para descargar medios de YouTube, Spotify y TikTok",
     version="1.0.0",
     docs_url="/docs" if not IS_PRODUCTION else None,  # Disable docs in production
-    redoc_url="/redoc" if not IS_PRODUCTION else None
+    redoc_url="/redoc" if not IS_PRODUCTION else None,
+    lifespan=lifespan
 )
 
 # Add Rate Limiting Middleware
-app.add_middleware(RateLimitMiddleware, requests_limit=RATE_LIMIT_REQUESTS, window=RATE_LIMIT_WINDOW)
+app.add_middleware(
+    RateLimitMiddleware,
+    requests_limit=RATE_LIMIT_REQUESTS,
+    window=RATE_LIMIT_WINDOW,
+    redis=redis_client
+)
 
 # CORS Configuration
 app.add_middleware(
@@ -117,8 +279,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Task storage (in production, use Redis or database)
-tasks_db: dict = {}
+# Task storage (Redis si REDIS_URL está configurado, si no LRU en memoria)
+task_store = TaskStore(redis_client)
 
 # Modelos de datos
 class DownloadRequest(BaseModel):
@@ -145,14 +307,25 @@ class FormatInfo(BaseModel):
     extension: str
     description: str
 
+# Respuesta de /api/formats (datos estáticos, se arma una sola vez)
+_FORMATS_PAYLOAD = {"formats": [f.model_dump() for f in (
+    FormatInfo(id="mp3_128", name="MP3 128kbps", extension="mp3", description="Calidad estándar, archivos pequeños"),
+    FormatInfo(id="mp3_192", name="MP3 192kbps", extension="mp3", description="Buena calidad"),
+    FormatInfo(id="mp3_320", name="MP3 320kbps", extension="mp3", description="Alta calidad"),
+    FormatInfo(id="flac", name="FLAC", extension="flac", description="Sin pérdida (lossless)"),
+    FormatInfo(id="wav", name="WAV", extension="wav", description="Sin compresión"),
+    FormatInfo(id="m4a", name="M4A (AAC)", extension="m4a", description="Buena calidad, compatible con Apple"),
+    FormatInfo(id="mp4", name="MP4 Video", extension="mp4", description="Video con audio"),
+)]}
+
 # Instancias de downloaders
-youtube_dl = YouTubeDownloader(DOWNLOADS_DIR)
-spotify_dl = SpotifyDownloader(DOWNLOADS_DIR)
-tiktok_dl = TikTokDownloader(DOWNLOADS_DIR)
+youtube_dl = get_youtube_downloader(str(DOWNLOADS_DIR), ytdlp_pool)
+spotify_dl = get_spotify_downloader(str(DOWNLOADS_DIR), ytdlp_pool)
+tiktok_dl = get_tiktok_downloader(str(DOWNLOADS_DIR))
 
 # ==================== ENDPOINTS ====================
 
-@app.get("/health")
+@app.get("/health", response_class=ORJSONResponse)
 async def health_check():
     """Health check del servidor"""
     return {
@@ -161,21 +334,12 @@ async def health_check():
         "version": "1.0.0"
     }
 
-@app.get("/api/formats")
+@app.get("/api/formats", response_class=ORJSONResponse)
 async def get_formats():
     """Obtener formatos de audio/video disponibles"""
-    formats = [
-        FormatInfo(id="mp3_128", name="MP3 128kbps", extension="mp3", description="Calidad estándar, archivos pequeños"),
-        FormatInfo(id="mp3_192", name="MP3 192kbps", extension="mp3", description="Buena calidad"),
-        FormatInfo(id="mp3_320", name="MP3 320kbps", extension="mp3", description="Alta calidad"),
-        FormatInfo(id="flac", name="FLAC", extension="flac", description="Sin pérdida (lossless)"),
-        FormatInfo(id="wav", name="WAV", extension="wav", description="Sin compresión"),
-        FormatInfo(id="m4a", name="M4A (AAC)", extension="m4a", description="Buena calidad, compatible con Apple"),
-        FormatInfo(id="mp4", name="MP4 Video", extension="mp4", description="Video con audio"),
-    ]
-    return {"formats": [f.model_dump() for f in formats]}
-
-@app.post("/api/agent/chat")
+    return _FORMATS_PAYLOAD
+
+@app.post("/api/agent/chat", response_class=ORJSONResponse)
 async def agent_chat(request: ChatRequest):
     """Chat con el Agente de IA"""
     return await media_agent.chat(request.message)
@@ -238,9 +402,9 @@ async def get_preview(request: PreviewRequest):
 @app.post("/api/download/youtube", response_model=TaskResponse)
 async def download_youtube(request: DownloadRequest):
     """Iniciar descarga de YouTube"""
-    task_id = str(uuid.uuid4())
+    task_id = secrets.token_hex(16)
     
-    tasks_db[task_id] = {
+    await task_store.set(task_id, {
         "status": "pending",
         "message": "Iniciando descarga de YouTube...",
         "progress": 0,
@@ -249,9 +413,9 @@ async def download_youtube(request: DownloadRequest):
         "format": request.format,
         "quality": request.quality,
         "created_at": datetime.now().isoformat()
-    }
+    })
     
-    asyncio.create_task(process_youtube_download(task_id, request.url, request.format, request.quality))
+    await enqueue_download(task_id, "youtube", request)
     
     return TaskResponse(
         task_id=task_id,
@@ -262,9 +426,9 @@ async def download_youtube(request: DownloadRequest):
 @app.post("/api/download/spotify", response_model=TaskResponse)
 async def download_spotify(request: DownloadRequest):
     """Iniciar descarga de Spotify"""
-    task_id = str(uuid.uuid4())
+    task_id = secrets.token_hex(16)
     
-    tasks_db[task_id] = {
+    await task_store.set(task_id, {
         "status": "pending",
         "message": "Iniciando descarga de Spotify...",
         "progress": 0,
@@ -272,11 +436,9 @@ async def download_spotify(request: DownloadRequest):
         "url": request.url,
         "format": request.format,
         "created_at": datetime.now().isoformat()
-    }
+    })
     
-    # Usar get_running_loop para obtener el loop actual (Python 3.10+)
-    loop = asyncio.get_running_loop()
-    loop.create_task(process_spotify_download(task_id, request.url, request.format))
+    await enqueue_download(task_id, "spotify", request)
     
     return TaskResponse(
         task_id=task_id,
@@ -287,9 +449,9 @@ async def download_spotify(request: DownloadRequest):
 @app.post("/api/download/tiktok", response_model=TaskResponse)
 async def download_tiktok(request: DownloadRequest):
     """Iniciar descarga de TikTok (sin watermark)"""
-    task_id = str(uuid.uuid4())
+    task_id = secrets.token_hex(16)
     
-    tasks_db[task_id] = {
+    await task_store.set(task_id, {
         "status": "pending",
         "message": "Iniciando descarga de TikTok...",
         "progress": 0,
@@ -297,9 +459,9 @@ async def download_tiktok(request: DownloadRequest):
         "url": request.url,
         "format": request.format,
         "created_at": datetime.now().isoformat()
-    }
+    })
     
-    asyncio.create_task(process_tiktok_download(task_id, request.url, request.format))
+    await enqueue_download(task_id, "tiktok", request)
     
     return TaskResponse(
         task_id=task_id,
@@ -310,10 +472,10 @@ async def download_tiktok(request: DownloadRequest):
 @app.get("/api/tasks/{task_id}", response_model=TaskResponse)
 async def get_task_status(task_id: str):
     """Obtener estado de una tarea de descarga"""
-    if task_id not in tasks_db:
+    task = await task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Tarea no encontrada")
     
-    task = tasks_db[task_id]
     return TaskResponse(
         task_id=task_id,
         status=task["status"],
@@ -327,37 +489,214 @@ async def get_task_status(task_id: str):
 @app.get("/api/files/{file_id}")
 async def download_file(file_id: str):
     """Descargar archivo completado"""
-    # Buscar archivo en tareas
-    for task_id, task in tasks_db.items():
-        if task.get("file_id") == file_id:
-            file_path = task.get("file_path")
-            if file_path and os.path.exists(file_path):
-                filename = task.get("filename", "download")
-                return FileResponse(
-                    path=file_path,
-                    filename=filename,
-                    media_type="application/octet-stream",
-                    headers={
-                        "Content-Disposition": f'attachment; filename="{filename}"'
-                    }
-                )
+    task = await task_store.get_by_file(file_id)
+    if task:
+        file_path = task.get("file_path")
+        try:
+            # Un solo stat: se reutiliza para Content-Length / ETag / Last-Modified
+            stat_result = os.stat(file_path) if file_path else None
+        except OSError:
+            stat_result = None
+        
+        if stat_result:
+            filename = task.get("filename", "download")
+            return LargeFileResponse(
+                path=file_path,
+                filename=filename,
+                stat_result=stat_result,
+                media_type="application/octet-stream",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{filename}"'
+                }
+            )
     
     raise HTTPException(status_code=404, detail="Archivo no encontrado")
 
 # ==================== BACKGROUND TASKS ====================
 
+async def enqueue_download(task_id: str, platform: str, request: DownloadRequest):
+    """Encolar una descarga (503 si la cola está llena)"""
+    try:
+        await download_queue.put_nowait(orjson.dumps({
+            "task_id": task_id,
+            "platform": platform,
+            "url": request.url,
+            "format": request.format,
+            "quality": request.quality
+        }))
+    except QueueFull:
+        await task_store.set(task_id, {
+            "status": "error",
+            "message": "Servidor ocupado",
+            "error": "Demasiadas descargas en cola, intenta más tarde"
+        })
+        raise HTTPException(status_code=503, detail="Demasiadas descargas en cola, intenta más tarde")
+
+async def resume_pending_downloads():
+    """Re-encolar los jobs que quedaron en disco al reiniciar y recrear sus tareas"""
+    # Primero los que estaban descargándose cuando el proceso murió
+    interrupted = await inflight_jobs.keys()
+    jobs = [await inflight_jobs.get(key) for key in interrupted]
+    
+    # La cola carga los jobs guardados pero no los cuenta como pendientes (task_done):
+    # sacarlos y volver a meterlos deja el contador consistente
+    while not download_queue.empty():
+        jobs.append(await download_queue.get_nowait())
+    
+    for raw in jobs:
+        job = orjson.loads(raw)
+        await task_store.set(job["task_id"], {
+            "status": "pending",
+            "message": "Descarga reanudada tras reinicio...",
+            "progress": 0,
+            "platform": job["platform"],
+            "url": job["url"],
+            "format": job["format"],
+            "quality": job["quality"],
+            "created_at": datetime.now().isoformat()
+        })
+        try:
+            await download_queue.put_nowait(raw)
+        except QueueFull:
+            # Los interrumpidos pueden exceder el tamaño de la cola
+            await task_store.set(job["task_id"], {
+                "status": "error",
+                "message": "Servidor ocupado",
+                "error": "Demasiadas descargas en cola, intenta más tarde"
+            })
+    
+    for key in interrupted:
+        await inflight_jobs.delete(key)
+    
+    if jobs:
+        print(f"[Worker] {len(jobs)} descargas reanudadas desde la cola en disco")
+
+async def dispatch_download(job: dict):
+    """Ejecutar una descarga de la cola"""
+    platform = job["platform"]
+    if platform == "youtube":
+        await process_youtube_download(job["task_id"], job["url"], job["format"], job["quality"])
+    elif platform == "spotify":
+        await process_spotify_download(job["task_id"], job["url"], job["format"])
+    elif platform == "tiktok":
+        await process_tiktok_download(job["task_id"], job["url"], job["format"])
+
+async def download_once(key: tuple, download: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Ejecutar una descarga, o esperar el resultado si ya hay una idéntica en curso
+    
+    key es (plataforma, url, formato, ...): las tareas con la misma key comparten
+    la descarga y el archivo resultante. Solo la descarga real ocupa un lugar del
+    límite por plataforma.
+    """
+    future = download_inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+    
+    future = asyncio.get_running_loop().create_future()
+    download_inflight[key] = future
+    try:
+        async with platform_semaphores[key[0]]:
+            result = await download()
+    except BaseException as e:
+        # Las tareas en espera reciben el error como resultado fallido
+        future.set_result({"success": False, "error": f"{type(e).__name__}: {str(e)}"})
+        raise
+    finally:
+        download_inflight.pop(key, None)
+    
+    future.set_result(result)
+    return result
+
+async def task_reaper():
+    """Eliminar cada TASK_REAP_INTERVAL segundos las tareas vencidas o sin archivo"""
+    while True:
+        await asyncio.sleep(TASK_REAP_INTERVAL)
+        removed = await task_store.reap()
+        if removed:
+            print(f"[Reaper] {removed} tareas eliminadas")
+
+async def download_worker():
+    """Worker que consume la cola de descargas"""
+    while True:
+        raw = await download_queue.get()
+        job = orjson.loads(raw)
+        await inflight_jobs.set(job["task_id"], raw)
+        try:
+            try:
+                await dispatch_download(job)
+            except Exception as e:
+                print(f"[Worker] Error procesando tarea {job.get('task_id')}: {str(e)}")
+            # Terminado (bien o con error): ya no hay que reanudarlo. Si el worker se
+            # cancela en el shutdown, el job queda registrado y se reanuda al arrancar
+            await inflight_jobs.delete(job["task_id"])
+        finally:
+            await download_queue.task_done()
+
+class ProgressReporter:
+    """
+    Progreso de una tarea (10-90) a partir del porcentaje de yt-dlp (0-100)
+    
+    Un solo writer guarda siempre el último valor: las escrituras no se solapan
+    ni llegan fuera de orden, y close() espera la pendiente antes del estado final.
+    """
+    
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self._current = 10
+        self._written = 10
+        self._writer: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    def update(self, percent: float):
+        progress = 10 + int(percent * 0.8)
+        # Video + audio se descargan por separado: no retroceder la barra
+        # (y solo escribir en el store cuando el valor cambia)
+        if self._closed or progress <= self._current:
+            return
+        self._current = progress
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._flush())
+    
+    async def _flush(self):
+        while self._written < self._current:
+            progress = self._current
+            try:
+                # update (no set): si la tarea ya no existe, no recrearla a medias
+                if not await task_store.update(self.task_id, {"progress": progress}):
+                    return
+            except Exception as e:
+                print(f"[Worker] No se pudo guardar el progreso de {self.task_id}: {e}")
+                return
+            self._written = progress
+    
+    async def close(self):
+        """Dejar de aceptar progreso y esperar la escritura en curso"""
+        self._closed = True
+        if self._writer is not None:
+            await self._writer
+
 async def process_youtube_download(task_id: str, url: str, format: str, quality: str):
     """Procesar descarga de YouTube en background"""
     try:
-        tasks_db[task_id]["status"] = "downloading"
-        tasks_db[task_id]["message"] = "Descargando de YouTube..."
-        tasks_db[task_id]["progress"] = 10
+        await task_store.set(task_id, {
+            "status": "downloading",
+            "message": "Descargando de YouTube...",
+            "progress": 10
+        })
         
-        result = await youtube_dl.download(url, format, quality)
+        progress = ProgressReporter(task_id)
+        try:
+            result = await download_once(
+                ("youtube", url, format, quality),
+                lambda: youtube_dl.download(url, format, quality, progress_callback=progress.update)
+            )
+        finally:
+            await progress.close()
         
         if result["success"]:
-            file_id = str(uuid.uuid4())
-            tasks_db[task_id].update({
+            file_id = secrets.token_hex(16)
+            await task_store.set(task_id, {
                 "status": "completed",
                 "message": "Descarga completada",
                 "progress": 100,
@@ -367,14 +706,15 @@ async def process_youtube_download(task_id: str, url: str, format: str, quality:
                 "title": result.get("title"),
                 "duration": result.get("duration")
             })
+            await task_store.set_file(file_id, task_id)
         else:
-            tasks_db[task_id].update({
+            await task_store.set(task_id, {
                 "status": "error",
                 "message": "Error en la descarga",
                 "error": result.get("error", "Error desconocido")
             })
     except Exception as e:
-        tasks_db[task_id].update({
+        await task_store.set(task_id, {
             "status": "error",
             "message": "Error en la descarga",
             "error": str(e)
@@ -384,16 +724,25 @@ async def process_spotify_download(task_id: str, url: str, format: str):
     """Procesar descarga de Spotify en background"""
     try:
         print(f"[Main] Iniciando descarga Spotify: {url}")
-        tasks_db[task_id]["status"] = "downloading"
-        tasks_db[task_id]["message"] = "Descargando de Spotify..."
-        tasks_db[task_id]["progress"] = 10
+        await task_store.set(task_id, {
+            "status": "downloading",
+            "message": "Descargando de Spotify...",
+            "progress": 10
+        })
         
-        result = await spotify_dl.download(url, format)
+        progress = ProgressReporter(task_id)
+        try:
+            result = await download_once(
+                ("spotify", url, format),
+                lambda: spotify_dl.download(url, format, progress_callback=progress.update)
+            )
+        finally:
+            await progress.close()
         print(f"[Main] Resultado Spotify: {result}")
         
         if result["success"]:
-            file_id = str(uuid.uuid4())
-            tasks_db[task_id].update({
+            file_id = secrets.token_hex(16)
+            await task_store.set(task_id, {
                 "status": "completed",
                 "message": "Descarga completada",
                 "progress": 100,
@@ -403,10 +752,11 @@ async def process_spotify_download(task_id: str, url: str, format: str):
                 "title": result.get("title"),
                 "artist": result.get("artist")
             })
+            await task_store.set_file(file_id, task_id)
         else:
             error_msg = result.get("error", "Error desconocido")
             print(f"[Main] Error en resultado Spotify: {error_msg}")
-            tasks_db[task_id].update({
+            await task_store.set(task_id, {
                 "status": "error",
                 "message": "Error en la descarga",
                 "error": error_msg
@@ -414,7 +764,7 @@ async def process_spotify_download(task_id: str, url: str, format: str):
     except Exception as e:
         error_detail = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
         print(f"[Main] Excepción en Spotify: {error_detail}")
-        tasks_db[task_id].update({
+        await task_store.set(task_id, {
             "status": "error",
             "message": "Error en la descarga",
             "error": f"Error: {type(e).__name__}: {str(e)}"
@@ -423,15 +773,17 @@ async def process_spotify_download(task_id: str, url: str, format: str):
 async def process_tiktok_download(task_id: str, url: str, format: str):
     """Procesar descarga de TikTok en background"""
     try:
-        tasks_db[task_id]["status"] = "downloading"
-        tasks_db[task_id]["message"] = "Descargando de TikTok (sin watermark)..."
-        tasks_db[task_id]["progress"] = 10
+        await task_store.set(task_id, {
+            "status": "downloading",
+            "message": "Descargando de TikTok (sin watermark)...",
+            "progress": 10
+        })
         
-        result = await tiktok_dl.download(url, format)
+        result = await download_once(("tiktok", url, format), lambda: tiktok_dl.download(url, format))
         
         if result["success"]:
-            file_id = str(uuid.uuid4())
-            tasks_db[task_id].update({
+            file_id = secrets.token_hex(16)
+            await task_store.set(task_id, {
                 "status": "completed",
                 "message": "Descarga completada",
                 "progress": 100,
@@ -439,19 +791,29 @@ async def process_tiktok_download(task_id: str, url: str, format: str):
                 "file_path": result["file_path"],
                 "filename": result["filename"]
             })
+            await task_store.set_file(file_id, task_id)
         else:
-            tasks_db[task_id].update({
+            await task_store.set(task_id, {
                 "status": "error",
                 "message": "Error en la descarga",
                 "error": result.get("error", "Error desconocido")
             })
     except Exception as e:
-        tasks_db[task_id].update({
+        await task_store.set(task_id, {
             "status": "error",
             "message": "Error en la descarga",
             "error": str(e)
         })
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop no existe en Windows
+        http="httptools",
+        # 1 por defecto: la cola en disco no admite varios procesos a la vez
+        workers=int(os.getenv("WORKERS", "1"))
+    )
@@ -1,10 +1,121 @@
 import os
 import re
 import json
-import subprocess
+import asyncio
+import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
-from groq import Groq
+from urllib.parse import quote_plus
+import httpx
+from groq import AsyncGroq
 from pydantic import BaseModel
+from yt_dlp import YoutubeDL
+
+from downloaders._cache import async_ttl_cache
+
+# yt-dlp en proceso para búsquedas (evita lanzar un proceso por búsqueda)
+_YDL_OPTIONS = {
+    "quiet": True,
+    "no_warnings": True,
+    "skip_download": True,
+    "extract_flat": True,
+    "socket_timeout": 10,  # que un thread colgado termine solo (el await abandona a los 15s)
+}
+_ydl_local = threading.local()
+
+# Búsquedas simultáneas al procesar listas de canciones
+SEARCH_CONCURRENCY = 5
+
+
+def _thread_ydl() -> YoutubeDL:
+    """YoutubeDL del thread actual (YoutubeDL no es thread-safe: una instancia por thread)"""
+    ydl = getattr(_ydl_local, "ydl", None)
+    if ydl is None:
+        ydl = _ydl_local.ydl = YoutubeDL(_YDL_OPTIONS)
+    return ydl
+
+
+# Substrings que toda URL soportada contiene (youtube.com / youtu.be, spotify.com, tiktok.com)
+_URL_HINTS = ("youtu", "spotify.com", "tiktok.com")
+
+
+def _search_entries(query: str, max_results: int) -> List[Dict]:
+    """
+    Ejecutar la búsqueda y convertir cada resultado a medida que llega
+    
+    Con process=False yt-dlp devuelve los resultados como generador (se van pidiendo
+    las páginas de búsqueda mientras se iteran) en lugar de armar la lista completa
+    """
+    info = _thread_ydl().extract_info(f"ytsearch{max_results}:{query}", download=False, process=False)
+    
+    results = []
+    for video in (info or {}).get('entries') or []:
+        if not video:
+            continue
+        thumbnails = video.get('thumbnails') or [{}]
+        results.append({
+            'title': video.get('title', 'Sin título'),
+            'url': f"https://youtube.com/watch?v={video.get('id')}",
+            'channel': video.get('channel') or video.get('uploader', 'Desconocido'),
+            'duration': video.get('duration'),
+            'thumbnail': video.get('thumbnail') or thumbnails[-1].get('url')
+        })
+    return results
+
+
+def normalize_query(query: str) -> str:
+    """Normalizar una búsqueda para usarla como clave de cache"""
+    return " ".join(query.lower().split())
+
+
+# Prompt del sistema (sin la indentación: menos tokens enviados al LLM en cada llamada)
+_SYSTEM_PROMPT_SOURCE = """
+    Eres el asistente inteligente de MediaGrab. Tu objetivo es ayudar al usuario a descargar música y videos.
+    
+    CAPACIDADES:
+    1. Puedes descargar de YouTube, Spotify y TikTok.
+    2. Si el usuario menciona una canción/artista, búscala en YouTube.
+    3. Si el usuario pega un link, detéctalo y prepáralo para descarga.
+    4. Puedes procesar listas de múltiples canciones.
+    
+    REGLAS:
+    1. Si el usuario envía una lista de canciones (nombres o links), identifícalas TODAS.
+    2. Siempre asume formato 'mp3' y calidad '320k' a menos que el usuario pida algo diferente.
+    3. Si detectas URLs, ponlas directamente en "url" del intention.
+    4. Si es un nombre de canción, ponlo en "query" para búsqueda.
+    5. Para Spotify usa platform="spotify", para TikTok usa platform="tiktok", para YouTube o búsquedas usa platform="youtube".
+    6. Para cada canción separa "artist" y "title" (déjalos vacíos si no los conoces).
+    7. Usa "skip_search": true solo si pusiste en "url" un link que conoces con certeza; si no, false.
+    
+    RESPONDE SIEMPRE en JSON con esta estructura:
+    {
+        "message": "<mensaje amigable al usuario>",
+        "intentions": [
+            {"query": "nombre o descripción", "artist": "artista", "title": "título", "url": "URL si existe", "skip_search": false, "format": "mp3", "quality": "320k", "platform": "youtube|spotify|tiktok"}
+        ],
+        "requires_folder": true,
+        "needs_search": false
+    }
+    
+    EJEMPLOS:
+    - Usuario: "descarga Bohemian Rhapsody de Queen"
+      Respuesta: {"message": "¡Perfecto! Buscaré Bohemian Rhapsody de Queen en YouTube.", "intentions": [{"query": "Bohemian Rhapsody Queen", "artist": "Queen", "title": "Bohemian Rhapsody", "skip_search": false, "format": "mp3", "quality": "320k", "platform": "youtube"}], "requires_folder": true}
+    
+    - Usuario: "https://youtu.be/xyz123"
+      Respuesta: {"message": "¡Link de YouTube detectado! Preparando descarga...", "intentions": [{"query": "YouTube Video", "url": "https://youtu.be/xyz123", "format": "mp3", "quality": "320k", "platform": "youtube"}], "requires_folder": true}
+    
+    - Usuario: "quiero estas canciones:\\n1. Despacito\\n2. Shape of You\\n3. Blinding Lights"
+      Respuesta: {"message": "¡Encontré 3 canciones en tu lista! Las buscaré en YouTube.", "intentions": [{"query": "Despacito Luis Fonsi", "artist": "Luis Fonsi", "title": "Despacito", ...}, {"query": "Shape of You Ed Sheeran", "artist": "Ed Sheeran", "title": "Shape of You", ...}, {"query": "Blinding Lights The Weeknd", "artist": "The Weeknd", "title": "Blinding Lights", ...}], "requires_folder": true}
+    
+    IMPORTANTE: Solo responde con JSON válido. Sé conciso y amigable.
+    """
+SYSTEM_PROMPT = textwrap.dedent(_SYSTEM_PROMPT_SOURCE).strip()
+print(
+    f"[Agent] System prompt: {len(SYSTEM_PROMPT)} caracteres "
+    f"({len(_SYSTEM_PROMPT_SOURCE) - len(SYSTEM_PROMPT)} de indentación eliminados por llamada)"
+)
+
 
 class SongIntention(BaseModel):
     query: str
@@ -21,113 +132,75 @@ class AgentResponse(BaseModel):
 
 class MediaAgent:
     def __init__(self, api_key: str):
-        self.client = Groq(api_key=api_key)
-        
-        # Patrones de URL
-        self.url_patterns = {
-            'youtube': re.compile(r'(https?://)?(www\.)?(youtube\.com/watch\?v=|youtu\.be/|youtube\.com/shorts/)[\w-]+', re.IGNORECASE),
-            'spotify': re.compile(r'(https?://)?(open\.)?spotify\.com/(track|album|playlist)/[\w]+', re.IGNORECASE),
-            'tiktok': re.compile(r'(https?://)?(www\.|vm\.)?tiktok\.com/[@\w./]+', re.IGNORECASE)
-        }
-        
-        self.system_prompt = """
-        Eres el asistente inteligente de MediaGrab. Tu objetivo es ayudar al usuario a descargar música y videos.
-        
-        CAPACIDADES:
-        1. Puedes descargar de YouTube, Spotify y TikTok.
-        2. Si el usuario menciona una canción/artista, búscala en YouTube.
-        3. Si el usuario pega un link, detéctalo y prepáralo para descarga.
-        4. Puedes procesar listas de múltiples canciones.
+        # Cliente async con pool de conexiones propio (reutiliza TCP/TLS entre llamadas al LLM)
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        self.client = AsyncGroq(api_key=api_key, http_client=self._http_client)
         
-        REGLAS:
-        1. Si el usuario envía una lista de canciones (nombres o links), identifícalas TODAS.
-        2. Siempre asume formato 'mp3' y calidad '320k' a menos que el usuario pida algo diferente.
-        3. Si detectas URLs, ponlas directamente en "url" del intention.
-        4. Si es un nombre de canción, ponlo en "query" para búsqueda.
-        5. Para Spotify usa platform="spotify", para TikTok usa platform="tiktok", para YouTube o búsquedas usa platform="youtube".
+        # Threads propios para las búsquedas: una búsqueda que excede el timeout sigue
+        # corriendo en su thread, y así no ocupa el executor por defecto de la app
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=SEARCH_CONCURRENCY,
+            thread_name_prefix="yt-search"
+        )
         
-        RESPONDE SIEMPRE en JSON con esta estructura:
-        {
-            "message": "<mensaje amigable al usuario>",
-            "intentions": [
-                {"query": "nombre o descripción", "url": "URL si existe", "format": "mp3", "quality": "320k", "platform": "youtube|spotify|tiktok"}
-            ],
-            "requires_folder": true,
-            "needs_search": false
-        }
-        
-        EJEMPLOS:
-        - Usuario: "descarga Bohemian Rhapsody de Queen"
-          Respuesta: {"message": "¡Perfecto! Buscaré Bohemian Rhapsody de Queen en YouTube.", "intentions": [{"query": "Bohemian Rhapsody Queen", "format": "mp3", "quality": "320k", "platform": "youtube"}], "requires_folder": true}
-        
-        - Usuario: "https://youtu.be/xyz123"
-          Respuesta: {"message": "¡Link de YouTube detectado! Preparando descarga...", "intentions": [{"query": "YouTube Video", "url": "https://youtu.be/xyz123", "format": "mp3", "quality": "320k", "platform": "youtube"}], "requires_folder": true}
-        
-        - Usuario: "quiero estas canciones:\n1. Despacito\n2. Shape of You\n3. Blinding Lights"
-          Respuesta: {"message": "¡Encontré 3 canciones en tu lista! Las buscaré en YouTube.", "intentions": [{"query": "Despacito Luis Fonsi", ...}, {"query": "Shape of You Ed Sheeran", ...}, {"query": "Blinding Lights The Weeknd", ...}], "requires_folder": true}
-        
-        IMPORTANTE: Solo responde con JSON válido. Sé conciso y amigable.
-        """
+        # Patrón único de URLs: el grupo con nombre indica la plataforma
+        self.url_pattern = re.compile(
+            r'(?P<youtube>(?:https?://)?(?:www\.)?(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/shorts/)[\w-]+)'
+            r'|(?P<spotify>(?:https?://)?(?:open\.)?spotify\.com/(?:track|album|playlist)/\w+)'
+            r'|(?P<tiktok>(?:https?://)?(?:www\.|vm\.)?tiktok\.com/[@\w./]+)',
+            re.IGNORECASE
+        )
+
+    async def close(self):
+        """Cerrar el cliente HTTP del LLM y los threads de búsqueda (shutdown de la app)"""
+        await self._http_client.aclose()
+        self._search_executor.shutdown(wait=False, cancel_futures=True)
 
     def detect_urls(self, text: str) -> List[Dict]:
         """Detectar URLs de plataformas conocidas en el texto"""
+        # Texto libre (lo más común): evitar el regex si no aparece ningún dominio
+        lowered = text.lower()
+        if not any(hint in lowered for hint in _URL_HINTS):
+            return []
+        
         found_urls = []
         
-        for platform, pattern in self.url_patterns.items():
-            matches = pattern.findall(text)
-            for match in matches:
-                # Reconstruir URL completa
-                if isinstance(match, tuple):
-                    url = ''.join(match)
-                else:
-                    url = match
+        for match in self.url_pattern.finditer(text):
+            url = match.group(0)
+            
+            # Asegurar que tenga https
+            if not url.lower().startswith('http'):
+                url = 'https://' + url
                 
-                # Asegurar que tenga https
-                if not url.startswith('http'):
-                    url = 'https://' + url
-                    
-                found_urls.append({
-                    'url': url,
-                    'platform': platform
-                })
+            found_urls.append({
+                'url': url,
+                'platform': match.lastgroup
+            })
         
         return found_urls
 
-    def search_youtube(self, query: str, max_results: int = 1) -> List[Dict]:
-        """Buscar en YouTube usando yt-dlp"""
+    # Resultados vacíos (error o timeout) no se guardan
+    @async_ttl_cache(ttl=3600, maxsize=1024, key=normalize_query, should_cache=bool)
+    async def search_youtube(self, query: str, max_results: int = 1) -> List[Dict]:
+        """Buscar en YouTube usando yt-dlp (en un thread, sin bloquear el event loop)"""
         try:
-            cmd = [
-                "yt-dlp",
-                f"ytsearch{max_results}:{query}",
-                "--dump-json",
-                "--no-download",
-                "--no-warnings",
-                "--flat-playlist"
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
-            
-            if result.returncode == 0 and result.stdout:
-                results = []
-                for line in result.stdout.strip().split('\n'):
-                    if line:
-                        try:
-                            video = json.loads(line)
-                            results.append({
-                                'title': video.get('title', 'Sin título'),
-                                'url': f"https://youtube.com/watch?v={video.get('id')}",
-                                'channel': video.get('channel') or video.get('uploader', 'Desconocido'),
-                                'duration': video.get('duration'),
-                                'thumbnail': video.get('thumbnail')
-                            })
-                        except json.JSONDecodeError:
-                            continue
-                return results
-            return []
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._search_executor, _search_entries, query, max_results),
+                timeout=15
+            )
         except Exception as e:
             print(f"[Agent] Error buscando en YouTube: {e}")
             return []
 
+    async def _search_one(self, query: str, sem: asyncio.Semaphore) -> List[Dict]:
+        """Buscar una canción respetando el límite de búsquedas simultáneas"""
+        async with sem:
+            return await self.search_youtube(query)
+
     async def chat(self, user_prompt: str) -> Dict:
         try:
             # Paso 1: Detectar URLs directamente en el input
@@ -156,10 +229,10 @@ class MediaAgent:
                 }
             
             # Paso 2: Llamar al LLM para procesar consultas de texto
-            completion = self.client.chat.completions.create(
+            completion = await self.client.chat.completions.create(
                 model="llama-3.3-70b-versatile",
                 messages=[
-                    {"role": "system", "content": self.system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
                 response_format={"type": "json_object"}
@@ -168,22 +241,35 @@ class MediaAgent:
             response_content = completion.choices[0].message.content
             ai_response = json.loads(response_content)
             
-            # Paso 3: Si hay queries sin URL, buscar en YouTube
-            enhanced_intentions = []
-            for intention in ai_response.get("intentions", []):
-                if intention.get("url"):
-                    # Ya tiene URL, usar directamente
-                    enhanced_intentions.append(intention)
-                elif intention.get("query") and intention.get("platform", "youtube") == "youtube":
-                    # Buscar en YouTube
-                    search_results = self.search_youtube(intention["query"])
-                    if search_results:
-                        intention["url"] = search_results[0]["url"]
-                        intention["query"] = search_results[0]["title"]
-                        intention["search_result"] = search_results[0]
-                    enhanced_intentions.append(intention)
-                else:
-                    enhanced_intentions.append(intention)
+            # Paso 3: Si hay queries sin URL, buscar en YouTube (en paralelo)
+            enhanced_intentions = ai_response.get("intentions", [])
+            needs_search = []
+            for intention in enhanced_intentions:
+                if intention.get("url") or intention.get("platform", "youtube") != "youtube":
+                    continue
+                
+                # Artista + título del LLM dan una búsqueda más precisa que la query libre
+                search_query = " ".join(
+                    part for part in (intention.get("artist"), intention.get("title")) if part
+                ) or intention.get("query")
+                if not search_query:
+                    continue
+                
+                # Link de búsqueda por si no se encuentra (o no se busca) el video
+                intention["search_url"] = f"https://music.youtube.com/search?q={quote_plus(search_query)}"
+                if not intention.get("skip_search"):
+                    needs_search.append((intention, search_query))
+            
+            sem = asyncio.Semaphore(SEARCH_CONCURRENCY)
+            all_results = await asyncio.gather(*(
+                self._search_one(search_query, sem) for _, search_query in needs_search
+            ))
+            
+            for (intention, _), search_results in zip(needs_search, all_results):
+                if search_results:
+                    intention["url"] = search_results[0]["url"]
+                    intention["query"] = search_results[0]["title"]
+                    intention["search_result"] = search_results[0]
             
             ai_response["intentions"] = enhanced_intentions
             
@@ -5,14 +5,292 @@ Convierte entre diferentes formatos de audio y video
 
 import asyncio
 import os
+import shutil
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Bytes finales de stderr que se conservan (suficiente para el mensaje de error)
+_STDERR_TAIL_BYTES = 8 * 1024
+_READ_CHUNK = 64 * 1024
+
+# Buffer del pipe de stderr en Linux (el default de 64 KiB obliga a más lecturas)
+_PIPE_SIZE = 1024 * 1024
+_F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", None)
+
+
+def _wide_pipe() -> Tuple[int, int]:
+    """os.pipe() con el buffer agrandado a _PIPE_SIZE (best-effort)"""
+    read_fd, write_fd = os.pipe()
+    try:
+        fcntl.fcntl(write_fd, _F_SETPIPE_SZ, _PIPE_SIZE)
+    except OSError:
+        # p. ej. límite de /proc/sys/fs/pipe-max-size: seguir con el buffer por defecto
+        pass
+    return read_fd, write_fd
+
+
+def _write_all(fd: int, data: bytes):
+    """Escribir todo en un fd bloqueante y cerrarlo (EOF para FFmpeg)"""
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    except BrokenPipeError:
+        # FFmpeg terminó antes de leer toda la entrada: el error sale por stderr
+        pass
+    finally:
+        os.close(fd)
+
+
+class _FFmpegPipes:
+    """
+    Pipes de un proceso FFmpeg (stderr siempre; stdin/stdout opcionales)
+    
+    En Linux se crean a mano para poder agrandarlos con F_SETPIPE_SZ
+    (ni asyncio ni uvloop exponen el fd de los pipes que crean);
+    en otros sistemas se usan los pipes de asyncio.
+    """
+    
+    def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.stdout: Optional[asyncio.StreamReader] = None
+        self.stderr: Optional[asyncio.StreamReader] = None
+        self._stdin_fd: Optional[int] = None
+        self._transports: list = []
+    
+    async def spawn(self, cmd: list, stdin: bool = False, stdout: bool = False) -> asyncio.subprocess.Process:
+        """Lanzar FFmpeg; stdin y stdout van a /dev/null salvo stdin=True / stdout=True"""
+        if _F_SETPIPE_SZ is None:
+            self.process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if stdin else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE if stdout else asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            self.stdout = self.process.stdout
+            self.stderr = self.process.stderr
+            return self.process
+        
+        # Extremos que hereda FFmpeg (el padre los cierra tras el spawn)
+        child_fds = []
+        stdin_fd = stdout_fd = None
+        try:
+            if stdin:
+                stdin_fd, self._stdin_fd = _wide_pipe()
+                child_fds.append(stdin_fd)
+            if stdout:
+                stdout_read, stdout_fd = _wide_pipe()
+                child_fds.append(stdout_fd)
+                self.stdout = await self._reader(stdout_read)
+            stderr_read, stderr_fd = _wide_pipe()
+            child_fds.append(stderr_fd)
+            self.stderr = await self._reader(stderr_read)
+            
+            # close_fds=False: los fds de Python son no heredables (PEP 446), así que
+            # no hace falta cerrarlos en el hijo, y con close_fds=True CPython descarta
+            # posix_spawn y hace fork() de todo el proceso. posix_spawn además requiere
+            # un ejecutable con ruta y nada de preexec_fn/start_new_session/cwd.
+            # (uvloop lanza siempre con libuv y no usa estos parámetros de la misma forma)
+            self.process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=stdin_fd if stdin else asyncio.subprocess.DEVNULL,
+                stdout=stdout_fd if stdout else asyncio.subprocess.DEVNULL,
+                stderr=stderr_fd,
+                close_fds=False
+            )
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            for fd in child_fds:
+                os.close(fd)
+        return self.process
+    
+    async def _reader(self, read_fd: int) -> asyncio.StreamReader:
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=_PIPE_SIZE, loop=loop)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader, loop=loop),
+            os.fdopen(read_fd, "rb", buffering=0)
+        )
+        self._transports.append(transport)
+        return reader
+    
+    async def feed(self, data: bytes):
+        """Escribir la entrada completa en stdin y cerrarlo"""
+        if self._stdin_fd is not None:
+            fd, self._stdin_fd = self._stdin_fd, None
+            await asyncio.to_thread(_write_all, fd, data)
+            return
+        
+        try:
+            self.process.stdin.write(data)
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.process.stdin.close()
+    
+    async def kill(self):
+        """Matar el proceso si sigue corriendo y esperar a que termine"""
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+    
+    def close(self):
+        """Cerrar los pipes del lado del padre"""
+        if self._stdin_fd is not None:
+            os.close(self._stdin_fd)
+            self._stdin_fd = None
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+
+async def _read_tail(stream: asyncio.StreamReader) -> bytes:
+    """Leer un stream hasta EOF conservando solo los últimos _STDERR_TAIL_BYTES"""
+    tail = bytearray()
+    while True:
+        chunk = await stream.read(_READ_CHUNK)
+        if not chunk:
+            return bytes(tail)
+        tail += chunk
+        if len(tail) > _STDERR_TAIL_BYTES:
+            del tail[:-_STDERR_TAIL_BYTES]
+
+
+def _stat(file_path: str) -> Optional[os.stat_result]:
+    """stat de un archivo (None si no existe)"""
+    try:
+        return os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+
+def _file_size(file_path: str) -> Optional[int]:
+    """Tamaño de un archivo con un solo stat (None si no existe)"""
+    st = _stat(file_path)
+    return st.st_size if st is not None else None
+
+
+def _usable_cpus() -> int:
+    """CPUs que el proceso puede usar (respeta affinity/cpuset del contenedor)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # macOS / Windows no tienen sched_getaffinity
+        return os.cpu_count() or 1
+
+
+# Cache de ffprobe: (tipo, ruta, mtime_ns, tamaño) -> resultado
+# Si el archivo cambia, cambian mtime/tamaño y la entrada vieja deja de usarse
+_META_CACHE: OrderedDict = OrderedDict()
+_META_CACHE_SIZE = 256
+
+
+def _meta_cache_key(kind: str, file_path: str, st: Optional[os.stat_result] = None) -> Optional[tuple]:
+    """Clave de cache del archivo (reutiliza el stat del caller si ya lo tiene)"""
+    if st is None:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+    return (kind, file_path, st.st_mtime_ns, st.st_size)
+
+
+def _meta_cache_get(key: Optional[tuple]):
+    if key is None or key not in _META_CACHE:
+        return None
+    _META_CACHE.move_to_end(key)
+    return _META_CACHE[key]
+
+
+def _meta_cache_set(key: Optional[tuple], value):
+    if key is None:
+        return
+    _META_CACHE[key] = value
+    _META_CACHE.move_to_end(key)
+    while len(_META_CACHE) > _META_CACHE_SIZE:
+        _META_CACHE.popitem(last=False)
+
+
+def _meta_cache_invalidate(file_path: str):
+    """Olvidar los resultados de un archivo (p. ej. cuando convert() lo sobrescribe)"""
+    for key in [key for key in _META_CACHE if key[1] == file_path]:
+        del _META_CACHE[key]
+
+
+def _bitrate_args(preset: dict) -> list:
+    return ["-b:a", preset["bitrate"]] if preset["bitrate"] else []
+
+
+# Argumentos de codec por formato de salida (reciben el preset de calidad)
+_CODEC_ARGS: Dict[str, Callable[[dict], list]] = {
+    "mp3": lambda preset: ["-codec:a", "libmp3lame", *_bitrate_args(preset)],
+    "m4a": lambda preset: ["-codec:a", "aac", *_bitrate_args(preset)],
+    "flac": lambda preset: ["-codec:a", "flac"],
+    "wav": lambda preset: ["-codec:a", "pcm_s16le"],
+    "ogg": lambda preset: ["-codec:a", "libvorbis", *_bitrate_args(preset)],
+}
+
+
+def _metadata_result(format_info: dict, tags: dict) -> dict:
+    """Respuesta de get_metadata a partir de la sección "format" de ffprobe"""
+    return {
+        "success": True,
+        "duration": float(format_info.get("duration", 0)),
+        "bitrate": int(format_info.get("bit_rate", 0)),
+        "format": format_info.get("format_name"),
+        "title": tags.get("title"),
+        "artist": tags.get("artist"),
+        "album": tags.get("album")
+    }
+
+
+# Codec por defecto de cada formato de salida: si la entrada ya lo trae,
+# basta con cambiar de contenedor (-c:a copy)
+_REMUX_CODECS: Dict[str, str] = {
+    "m4a": "aac",
+    "aac": "aac",
+    "ogg": "vorbis",
+    "flac": "flac",
+    "mp3": "mp3",
+}
+
+
+# Muxer para salida por pipe (no hay extensión de la que deducirlo);
+# m4a va fragmentado porque en un pipe no se puede reescribir el moov al final
+_PIPE_MUXER_ARGS: Dict[str, list] = {
+    "mp3": ["-f", "mp3"],
+    "m4a": ["-f", "ipod", "-movflags", "frag_keyframe+empty_moov"],
+    "aac": ["-f", "adts"],
+    "flac": ["-f", "flac"],
+    "wav": ["-f", "wav"],
+    "ogg": ["-f", "ogg"],
+}
+
+# Marcador de la cantidad de threads en un comando FFmpeg: se reemplaza al
+# obtener el turno, cuando ya se sabe cuántos trabajos están corriendo
+_THREADS = object()
 
 
 class AudioConverter:
     """Servicio de conversión de audio usando FFmpeg"""
     
-    SUPPORTED_FORMATS = ["mp3", "m4a", "wav", "flac", "ogg", "aac"]
+    SUPPORTED_FORMATS = frozenset({"mp3", "m4a", "wav", "flac", "ogg", "aac"})
+    
+    # Entradas con video: la salida es solo audio, el stream de video se descarta (-vn)
+    VIDEO_EXTENSIONS = frozenset({".mp4", ".mkv", ".mov", ".webm", ".avi", ".flv"})
     
     QUALITY_PRESETS = {
         "low": {"bitrate": "128k", "sample_rate": "44100"},
@@ -21,33 +299,143 @@ class AudioConverter:
         "lossless": {"bitrate": None, "sample_rate": "48000"},
     }
     
-    def __init__(self, output_dir: Optional[Path] = None):
+    def __init__(
+        self,
+        output_dir: Optional[Path] = None,
+        max_workers: Optional[int] = None
+    ):
+        """
+        Args:
+            output_dir: Directorio de salida por defecto
+            max_workers: Procesos FFmpeg simultáneos (por defecto, uno por CPU usable)
+        """
         self.output_dir = output_dir or Path("./converted")
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._output_dir_str = str(self.output_dir)
+        
+        # Rutas absolutas resueltas una vez: evita recorrer el PATH en cada exec
+        # (y un ejecutable con ruta es requisito de posix_spawn)
+        self._ffmpeg = shutil.which("ffmpeg") or "ffmpeg"
+        self._ffprobe = shutil.which("ffprobe") or "ffprobe"
+        if self._ffmpeg == "ffmpeg":
+            print("[Converter] FFmpeg no encontrado en el PATH: las conversiones van a fallar")
+        
+        # Limita los FFmpeg en paralelo para no saturar CPU/disco
+        self._cpus = _usable_cpus()
+        self._max_workers = max_workers or self._cpus
+        self._sem = asyncio.Semaphore(self._max_workers)
+        self._active_jobs = 0
+    
+    def _is_video(self, input_path: str) -> bool:
+        return os.path.splitext(input_path)[1].lower() in self.VIDEO_EXTENSIONS
+    
+    def _default_output_path(self, input_path: str, output_format: str) -> str:
+        """Ruta de salida por defecto: mismo nombre que la entrada en output_dir"""
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        return os.path.join(self._output_dir_str, f"{stem}.{output_format}")
+    
+    def _thread_count(self) -> str:
+        """
+        Threads por FFmpeg: las CPUs usables repartidas entre los trabajos activos
+        
+        Se fija explícitamente porque la autodetección de FFmpeg no ve los
+        límites del contenedor/cgroup y sobresuscribe los cores. Se llama con
+        el turno ya tomado (_slot), así que el trabajo actual está contado.
+        """
+        jobs = min(max(self._active_jobs, 1), self._max_workers)
+        return str(max(1, self._cpus // jobs))
+    
+    def _format_args(self, output_format: str, preset: dict, source_rate: Optional[str] = None) -> list:
+        """Argumentos de codec, bitrate y sample rate para un formato de salida"""
+        # Opciones de codec según formato (aac: FFmpeg elige el codec por la extensión)
+        args = _CODEC_ARGS[output_format](preset) if output_format in _CODEC_ARGS else []
+        
+        # Sample rate (si la entrada ya lo tiene, -ar solo agregaría un resampler)
+        if preset["sample_rate"] and preset["sample_rate"] != source_rate:
+            args.extend(["-ar", preset["sample_rate"]])
+        
+        args.extend(["-threads", _THREADS])
+        return args
+    
+    @asynccontextmanager
+    async def _slot(self):
+        """Turno para lanzar un FFmpeg (límite de procesos + conteo de trabajos activos)"""
+        async with self._sem:
+            self._active_jobs += 1
+            try:
+                yield
+            finally:
+                self._active_jobs -= 1
+    
+    async def _run_ffmpeg(self, cmd: list) -> Tuple[int, str]:
+        """
+        Ejecutar FFmpeg respetando el límite de procesos simultáneos
+        
+        stdout se descarta; de stderr solo se guarda el final y solo se
+        decodifica si FFmpeg falló (en éxito el mensaje es "")
+        """
+        returncode, _, error = await self._run_ffmpeg_pipes(cmd)
+        return returncode, error
+    
+    async def _run_ffmpeg_pipes(self, cmd: list, input_data: Optional[bytes] = None, capture_stdout: bool = False) -> Tuple[int, bytes, str]:
+        """
+        Ejecutar FFmpeg con stdin/stdout opcionales por pipe
+        
+        Returns:
+            tupla (returncode, stdout capturado o b"", final de stderr si falló o "")
+        """
+        pipes = _FFmpegPipes()
+        async with self._slot():
+            threads = self._thread_count()
+            cmd = [threads if arg is _THREADS else arg for arg in cmd]
+            try:
+                process = await pipes.spawn(cmd, stdin=input_data is not None, stdout=capture_stdout)
+                
+                jobs = [_read_tail(pipes.stderr), process.wait()]
+                if capture_stdout:
+                    jobs.append(pipes.stdout.read())
+                if input_data is not None:
+                    jobs.append(pipes.feed(input_data))
+                tail, _, *rest = await asyncio.gather(*jobs)
+                output = rest[0] if capture_stdout else b""
+            except BaseException:
+                # Cancelación: no dejar el FFmpeg corriendo
+                await pipes.kill()
+                raise
+            finally:
+                pipes.close()
+        
+        if process.returncode == 0:
+            return 0, output, ""
+        return process.returncode, output, tail.decode('utf-8', errors='ignore')
     
     async def convert(
         self,
         input_path: str,
         output_format: str,
         quality: str = "high",
-        output_path: Optional[str] = None
+        output_path: Optional[str] = None,
+        force_reencode: bool = False
     ) -> dict:
         """
         Convertir archivo de audio a otro formato
         
+        Si la entrada ya está en el formato de salida se copia el stream de audio
+        sin recodificar (salvo con quality="lossless" o force_reencode=True).
+        
         Args:
             input_path: Ruta al archivo de entrada
             output_format: Formato de salida
             quality: Preset de calidad (low, medium, high, lossless)
             output_path: Ruta de salida opcional
+            force_reencode: Recodificar aunque la entrada ya tenga el formato o codec de salida
         
         Returns:
             dict con success, output_path, error
         """
         try:
-            input_file = Path(input_path)
-            
-            if not input_file.exists():
+            input_stat = _stat(input_path)
+            if input_stat is None:
                 return {
                     "success": False,
                     "error": f"Archivo no encontrado: {input_path}"
@@ -60,65 +448,49 @@ class AudioConverter:
                 }
             
             # Generar ruta de salida
-            if output_path:
-                out_file = Path(output_path)
-            else:
-                out_file = self.output_dir / f"{input_file.stem}.{output_format}"
+            out_file = str(output_path) if output_path else self._default_output_path(input_path, output_format)
             
             # Obtener configuración de calidad
-            preset = self.QUALITY_PRESETS.get(quality, self.QUALITY_PRESETS["high"])
+            preset = self.QUALITY_PRESETS.get(quality) or self.QUALITY_PRESETS["high"]
             
             # Construir comando FFmpeg
-            cmd = ["ffmpeg", "-i", str(input_file), "-y"]
-            
-            # Agregar opciones según formato
-            if output_format == "mp3":
-                cmd.extend(["-codec:a", "libmp3lame"])
-                if preset["bitrate"]:
-                    cmd.extend(["-b:a", preset["bitrate"]])
-                    
-            elif output_format == "m4a":
-                cmd.extend(["-codec:a", "aac"])
-                if preset["bitrate"]:
-                    cmd.extend(["-b:a", preset["bitrate"]])
-                    
-            elif output_format == "flac":
-                cmd.extend(["-codec:a", "flac"])
-                
-            elif output_format == "wav":
-                cmd.extend(["-codec:a", "pcm_s16le"])
-                
-            elif output_format == "ogg":
-                cmd.extend(["-codec:a", "libvorbis"])
-                if preset["bitrate"]:
-                    cmd.extend(["-b:a", preset["bitrate"]])
+            cmd = [self._ffmpeg, "-nostdin", "-nostats", "-filter_threads", _THREADS, "-i", input_path, "-y"]
             
-            # Sample rate
-            if preset["sample_rate"]:
-                cmd.extend(["-ar", preset["sample_rate"]])
+            # La salida es solo audio: no decodificar el stream de video
+            if self._is_video(input_path):
+                cmd.append("-vn")
             
-            cmd.append(str(out_file))
+            same_format = os.path.splitext(input_path)[1].lower().lstrip(".") == output_format
+            can_copy = quality != "lossless" and not force_reencode
             
-            # Ejecutar FFmpeg
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            # Codec y sample rate de la entrada (ffprobe en cache); no hace falta si se copia igual
+            source = {} if can_copy and same_format else await self._source_stream(input_path, input_stat)
+            source_codec = source.get("codec_name")
+            
+            if can_copy and (same_format or (source_codec and source_codec == _REMUX_CODECS.get(output_format))):
+                # Mismo formato, o mismo codec en otro contenedor (p. ej. aac de un mp4 a m4a):
+                # copiar el audio sin decodificar ni codificar
+                cmd.extend(["-c:a", "copy"])
+            else:
+                cmd.extend(self._format_args(output_format, preset, source.get("sample_rate")))
+            cmd.append(out_file)
             
-            stdout, stderr = await process.communicate()
+            # Ejecutar FFmpeg
+            returncode, stderr = await self._run_ffmpeg(cmd)
+            _meta_cache_invalidate(out_file)
             
-            if process.returncode == 0 and out_file.exists():
+            size = _file_size(out_file) if returncode == 0 else None
+            if size is not None:
                 return {
                     "success": True,
-                    "output_path": str(out_file),
-                    "filename": out_file.name,
-                    "size": out_file.stat().st_size
+                    "output_path": out_file,
+                    "filename": os.path.basename(out_file),
+                    "size": size
                 }
             
             return {
                 "success": False,
-                "error": stderr.decode('utf-8', errors='ignore')
+                "error": stderr
             }
             
         except FileNotFoundError:
@@ -132,6 +504,158 @@ class AudioConverter:
                 "error": str(e)
             }
     
+    async def convert_bytes(
+        self,
+        data: bytes,
+        input_format: str,
+        output_format: str,
+        quality: str = "high"
+    ) -> dict:
+        """
+        Convertir audio que ya está en memoria (entrada por stdin, salida por stdout)
+        
+        Evita los archivos temporales en pipelines subida -> conversión -> subida.
+        La entrada tiene que poder leerse sin seek (p. ej. un m4a con el moov
+        al final no sirve).
+        
+        Args:
+            data: Audio de entrada
+            input_format: Formato de la entrada (demuxer de FFmpeg: mp3, m4a, flac, ...)
+            output_format: Formato de salida
+            quality: Preset de calidad (low, medium, high, lossless)
+        
+        Returns:
+            dict con success, data (bytes convertidos), size, error
+        """
+        if output_format not in self.SUPPORTED_FORMATS:
+            return {
+                "success": False,
+                "error": f"Formato no soportado: {output_format}"
+            }
+        
+        preset = self.QUALITY_PRESETS.get(quality) or self.QUALITY_PRESETS["high"]
+        cmd = [
+            self._ffmpeg, "-nostats", "-filter_threads", _THREADS,
+            "-f", input_format, "-i", "pipe:0", "-vn",
+            *self._format_args(output_format, preset),
+            *_PIPE_MUXER_ARGS[output_format], "pipe:1"
+        ]
+        
+        try:
+            returncode, output, error = await self._run_ffmpeg_pipes(cmd, input_data=data, capture_stdout=True)
+        except FileNotFoundError:
+            return {
+                "success": False,
+                "error": "FFmpeg no está instalado"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        
+        if returncode == 0:
+            return {
+                "success": True,
+                "data": output,
+                "size": len(output)
+            }
+        
+        return {
+            "success": False,
+            "error": error
+        }
+    
+    async def convert_many(self, input_path: str, outputs: List[dict]) -> List[dict]:
+        """
+        Convertir un archivo a varios formatos con un solo proceso FFmpeg
+        
+        La entrada se decodifica una sola vez y se codifica en cada salida
+        (p. ej. mp3 + m4a + flac del mismo archivo).
+        
+        Args:
+            input_path: Ruta al archivo de entrada
+            outputs: Lista de dicts con format, quality (opcional) y path (opcional)
+        
+        Returns:
+            lista con un dict por salida (success, output_path, error), en el mismo orden
+        """
+        try:
+            input_stat = _stat(input_path)
+            if input_stat is None:
+                error = {"success": False, "error": f"Archivo no encontrado: {input_path}"}
+                return [dict(error) for _ in outputs]
+            
+            cmd = [self._ffmpeg, "-nostdin", "-nostats", "-filter_threads", _THREADS, "-i", input_path, "-y"]
+            source_rate = (await self._source_stream(input_path, input_stat)).get("sample_rate")
+            results: List[Optional[dict]] = []
+            out_files = []
+            
+            supported = self.SUPPORTED_FORMATS
+            presets = self.QUALITY_PRESETS
+            
+            for output in outputs:
+                output_format = output.get("format")
+                if output_format not in supported:
+                    results.append({"success": False, "error": f"Formato no soportado: {output_format}"})
+                    continue
+                
+                if output.get("path"):
+                    out_file = str(output["path"])
+                else:
+                    out_file = self._default_output_path(input_path, output_format)
+                
+                preset = presets.get(output.get("quality")) or presets["high"]
+                
+                # Cada salida toma el audio de la entrada y termina en su ruta
+                cmd.extend(["-map", "0:a", *self._format_args(output_format, preset, source_rate), out_file])
+                results.append(None)
+                out_files.append(out_file)
+            
+            if not out_files:
+                return results
+            
+            # Ejecutar FFmpeg (un solo decode para todas las salidas)
+            returncode, error = await self._run_ffmpeg(cmd)
+            for out_file in out_files:
+                _meta_cache_invalidate(out_file)
+            
+            pending = iter(out_files)
+            for i, result in enumerate(results):
+                if result is not None:
+                    continue
+                out_file = next(pending)
+                size = _file_size(out_file) if returncode == 0 else None
+                if size is not None:
+                    results[i] = {
+                        "success": True,
+                        "output_path": out_file,
+                        "filename": os.path.basename(out_file),
+                        "size": size
+                    }
+                else:
+                    results[i] = {"success": False, "output_path": out_file, "error": error}
+            
+            return results
+            
+        except FileNotFoundError:
+            return [{"success": False, "error": "FFmpeg no está instalado"} for _ in outputs]
+        except Exception as e:
+            return [{"success": False, "error": str(e)} for _ in outputs]
+    
+    async def convert_batch(self, jobs: List[dict]) -> List[dict]:
+        """
+        Convertir varios archivos en paralelo (máximo max_workers FFmpeg a la vez)
+        
+        Args:
+            jobs: Lista de dicts con los argumentos de convert()
+                  (input_path, output_format, quality, output_path)
+        
+        Returns:
+            lista con el resultado de cada conversión, en el mismo orden
+        """
+        return await asyncio.gather(*(self.convert(**job) for job in jobs))
+    
     async def extract_audio(
         self,
         video_path: str,
@@ -141,27 +665,77 @@ class AudioConverter:
         """Extraer audio de un video"""
         return await self.convert(video_path, output_format, quality)
     
+    async def _run_ffprobe(self, args: List[str]) -> Optional[bytes]:
+        """Ejecutar ffprobe en silencio; stdout, o None si falló"""
+        process = await asyncio.create_subprocess_exec(
+            self._ffprobe, "-v", "quiet", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        
+        stdout, _ = await process.communicate()
+        return stdout if process.returncode == 0 else None
+    
+    async def _probe(self, file_path: str, st: Optional[os.stat_result] = None) -> Optional[dict]:
+        """
+        Leer de ffprobe la sección "format" (duración, bitrate, contenedor y tags)
+        y el primer stream de audio
+        
+        Una sola ejecución de ffprobe sirve a get_duration, get_metadata y a la
+        detección de remux; el resultado queda en cache mientras el archivo no cambie.
+        
+        Args:
+            st: stat del archivo si el caller ya lo hizo (evita repetirlo para la clave del cache)
+        
+        Returns:
+            dict con "format" y "streams" de ffprobe, o None si ffprobe no pudo leer el archivo
+        """
+        key = _meta_cache_key("probe", file_path, st)
+        cached = _meta_cache_get(key)
+        if cached is not None:
+            return cached
+        
+        stdout = await self._run_ffprobe([
+            "-print_format", "json",
+            "-show_format",
+            "-show_streams",
+            "-select_streams", "a:0",
+            file_path
+        ])
+        if stdout is None:
+            return None
+        
+        info = orjson.loads(stdout)
+        probe = {"format": info.get("format", {}), "streams": info.get("streams", [])}
+        _meta_cache_set(key, probe)
+        return probe
+    
+    async def _probe_format(self, file_path: str) -> Optional[dict]:
+        """Sección "format" de ffprobe, o None si ffprobe no pudo leer el archivo"""
+        probe = await self._probe(file_path)
+        return probe["format"] if probe is not None else None
+    
+    async def _probe_audio_stream(self, file_path: str, st: Optional[os.stat_result] = None) -> Optional[dict]:
+        """Primer stream de audio según ffprobe, o None si no hay"""
+        probe = await self._probe(file_path, st)
+        if not probe or not probe["streams"]:
+            return None
+        return probe["streams"][0]
+    
+    async def _source_stream(self, input_path: str, st: Optional[os.stat_result] = None) -> dict:
+        """Stream de audio de la entrada ({} si ffprobe no está o no pudo leerlo)"""
+        try:
+            return await self._probe_audio_stream(input_path, st) or {}
+        except (OSError, ValueError):
+            # Sin ffprobe o salida ilegible: convertir sin esa información
+            return {}
+    
     async def get_duration(self, file_path: str) -> Optional[float]:
         """Obtener duración de un archivo de audio/video en segundos"""
         try:
-            cmd = [
-                "ffprobe",
-                "-v", "quiet",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                file_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, _ = await process.communicate()
-            
-            if process.returncode == 0:
-                return float(stdout.decode().strip())
+            format_info = await self._probe_format(file_path)
+            if format_info and format_info.get("duration"):
+                return float(format_info["duration"])
             
             return None
             
@@ -171,39 +745,46 @@ class AudioConverter:
     async def get_metadata(self, file_path: str) -> dict:
         """Obtener metadatos de un archivo de audio"""
         try:
-            cmd = [
-                "ffprobe",
-                "-v", "quiet",
-                "-print_format", "json",
-                "-show_format",
-                file_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            format_info = await self._probe_format(file_path)
+            
+            if format_info is not None:
+                return _metadata_result(format_info, format_info.get("tags", {}))
             
-            stdout, _ = await process.communicate()
+            return {"success": False, "error": "Could not read metadata"}
             
-            if process.returncode == 0:
-                import json
-                data = json.loads(stdout.decode())
-                format_info = data.get("format", {})
-                tags = format_info.get("tags", {})
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    async def get_metadata_fast(self, file_path: str) -> dict:
+        """
+        Obtener los mismos metadatos que get_metadata pidiéndole a ffprobe solo
+        esos campos, en formato clave=valor (sin JSON ni streams)
+        
+        Para introspección completa (codec, sample rate, todos los tags) usar _probe.
+        """
+        try:
+            key = _meta_cache_key("fields", file_path)
+            fields = _meta_cache_get(key)
+            
+            if fields is None:
+                stdout = await self._run_ffprobe([
+                    "-of", "default=noprint_wrappers=1",
+                    "-show_entries", "format=duration,bit_rate,format_name:format_tags=title,artist,album",
+                    file_path
+                ])
+                if stdout is None:
+                    return {"success": False, "error": "Could not read metadata"}
                 
-                return {
-                    "success": True,
-                    "duration": float(format_info.get("duration", 0)),
-                    "bitrate": int(format_info.get("bit_rate", 0)),
-                    "format": format_info.get("format_name"),
-                    "title": tags.get("title"),
-                    "artist": tags.get("artist"),
-                    "album": tags.get("album")
-                }
+                # "N/A" = campo desconocido para ffprobe
+                fields = dict(
+                    line.split("=", 1) for line in stdout.decode("utf-8", errors="replace").splitlines()
+                    if "=" in line and not line.endswith("=N/A")
+                )
+                _meta_cache_set(key, fields)
             
-            return {"success": False, "error": "Could not read metadata"}
+            # Los tags salen como TAG:title (las mayúsculas dependen del contenedor)
+            tags = {name[4:].lower(): value for name, value in fields.items() if name.startswith("TAG:")}
+            return _metadata_result(fields, tags)
             
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -0,0 +1,126 @@
+"""
+Task Store - estado de las tareas de descarga
+Usa hashes de Redis con TTL (compartido entre workers) o un LRU en memoria para desarrollo
+"""
+
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import orjson
+from redis.asyncio import Redis
+
+# HSET solo si la tarea sigue existiendo (no recrear hashes parciales de tareas vencidas)
+UPDATE_EXISTING_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+
+class TaskStore:
+    """Almacén de tareas: task:{id} (hash) + file:{file_id} -> task_id"""
+
+    def __init__(self, redis: Optional[Redis] = None, ttl: int = 24 * 3600, max_tasks: int = 10000):
+        self.redis = redis
+        self.ttl = ttl
+        self.max_tasks = max_tasks
+        self._update_script = redis.register_script(UPDATE_EXISTING_LUA) if redis else None
+
+        # Fallback en memoria (un solo proceso)
+        self._tasks: "OrderedDict[str, dict]" = OrderedDict()
+        self._file_index: Dict[str, str] = {}  # file_id -> task_id
+
+    async def set(self, task_id: str, mapping: dict):
+        """Crear o actualizar campos de una tarea (renueva el TTL)"""
+        if self.redis:
+            key = f"task:{task_id}"
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping={field: orjson.dumps(value) for field, value in mapping.items()})
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            return
+
+        task = self._tasks.setdefault(task_id, {})
+        task.update(mapping)
+        self._tasks.move_to_end(task_id)
+        while len(self._tasks) > self.max_tasks:
+            _, evicted = self._tasks.popitem(last=False)
+            self._file_index.pop(evicted.get("file_id"), None)
+
+    async def update(self, task_id: str, mapping: dict) -> bool:
+        """
+        Actualizar campos de una tarea solo si todavía existe
+        
+        Returns:
+            False si la tarea ya expiró o fue eliminada (no se recrea)
+        """
+        if self.redis:
+            args = [item for field, value in mapping.items() for item in (field, orjson.dumps(value))]
+            return bool(await self._update_script(keys=[f"task:{task_id}"], args=args))
+        
+        task = self._tasks.get(task_id)
+        if task is None:
+            return False
+        task.update(mapping)
+        return True
+    
+    async def get(self, task_id: str) -> Optional[dict]:
+        """Obtener una tarea (None si no existe o expiró)"""
+        if self.redis:
+            data = await self.redis.hgetall(f"task:{task_id}")
+            if not data:
+                return None
+            return {field.decode(): orjson.loads(value) for field, value in data.items()}
+
+        task = self._tasks.get(task_id)
+        return dict(task) if task is not None else None
+
+    async def set_file(self, file_id: str, task_id: str):
+        """Registrar el archivo generado por una tarea"""
+        if self.redis:
+            await self.redis.set(f"file:{file_id}", task_id, ex=self.ttl)
+            return
+
+        await self.set(task_id, {"file_id": file_id})
+        self._file_index[file_id] = task_id
+
+    async def get_by_file(self, file_id: str) -> Optional[dict]:
+        """Obtener la tarea que generó un archivo"""
+        if self.redis:
+            task_id = await self.redis.get(f"file:{file_id}")
+            if task_id is None:
+                return None
+            return await self.get(task_id.decode())
+
+        task_id = self._file_index.get(file_id)
+        if task_id is None:
+            return None
+        return await self.get(task_id)
+
+    async def reap(self) -> int:
+        """
+        Eliminar tareas en memoria más viejas que el TTL o cuyo archivo ya no existe
+
+        En Redis no hace nada: las claves expiran solas con su TTL.
+
+        Returns:
+            cantidad de tareas eliminadas
+        """
+        if self.redis:
+            return 0
+
+        cutoff = (datetime.now() - timedelta(seconds=self.ttl)).isoformat()
+        expired = [
+            task_id for task_id, task in self._tasks.items()
+            if task.get("created_at", cutoff) < cutoff
+            or (task.get("file_path") and not os.path.exists(task["file_path"]))
+        ]
+
+        for task_id in expired:
+            task = self._tasks.pop(task_id)
+            self._file_index.pop(task.get("file_id"), None)
+        return len(expired)
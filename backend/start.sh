@@ -1,3 +1,4 @@
 #!/bin/bash
 # Start script for Railway deployment
-exec uvicorn main:app --host 0.0.0.0 --port "${PORT:-8000}"
+exec uvicorn main:app --host 0.0.0.0 --port "${PORT:-8000}" \
+    --loop uvloop --http httptools --workers "${WORKERS:-1}"